@@ -1,12 +1,18 @@
-from rdflib import Graph, RDFS, RDF, Namespace
-import json, yaml, os
+from rdflib import RDFS, RDF, Namespace
+import argparse, yaml, os, tempfile
 
-# Cargar configuración
-cfg = yaml.safe_load(open("/home/pi/Documents/kg-llm/config.yaml", encoding="utf-8"))
+import entity_store
+import triples_stream
+from graph_snapshot import load_graph
+
+# Cargar configuración (KG_LLM_CONFIG permite usar otra, p. ej. en bench.py)
+CONFIG = os.environ.get("KG_LLM_CONFIG", "/home/pi/Documents/kg-llm/config.yaml")
+cfg = yaml.safe_load(open(CONFIG, encoding="utf-8"))
 
 TTL = cfg["paths"]["ttl"]
 OUT = cfg["paths"]["entities"]       # versión simple
 EXP = cfg["paths"]["expanded"]       # versión expandida
+SNAP = cfg["paths"].get("snapshot")  # copia binaria del TTL (se regenera sola)
 
 # Namespace de tu ontología
 FEST = Namespace("http://example.org/festividades#")
@@ -16,78 +22,202 @@ DESC_BREVE = FEST.descripcionBreve
 DESC_ETNO = FEST.descripcionEtnografica
 FUENTE_TXT = FEST.fuenteTexto
 
+# Nivel A/B/C para embeddings y RAG (el nivel C no debe generar embeddings)
+NIVEL = FEST.nivelEmbeddings
+
+# Predicados que se guardan como campos propios (no como relaciones)
+TEXT_PREDICATES = {
+    RDFS.label: "label",
+    RDFS.comment: "comment",
+    DESC_BREVE: "descripcionBreve",
+    DESC_ETNO: "descripcionEtnografica",
+    FUENTE_TXT: "fuenteTexto",
+    NIVEL: "nivelEmbeddings",
+}
+
+
+def _new_record():
+    return {"fields": {}, "types": [], "relations": []}
+
+
+def _add_triple(rec, p, o):
+    field = TEXT_PREDICATES.get(p)
+    if field is not None:
+        rec["fields"].setdefault(field, []).append(o)
+    elif p == RDF.type:
+        rec["types"].append(o)
+    else:
+        rec["relations"].append((p, o))
+
+
+def pick_value(values):
+    """
+    Un solo valor para un campo con varios: primero los literales @es y,
+    entre ellos, el menor. No depende del orden en que lleguen los triples,
+    así que grafo, snapshot y modo streaming dan la misma entidad.
+    """
+    if not values:
+        return None
+    return min(values, key=lambda v: (getattr(v, "language", None) != "es", str(v)))
+
+
+def group_by_subject(g):
+    """
+    Recorre los triples una sola vez y los agrupa por sujeto.
+    Cada registro guarda todos los valores de cada campo de texto (se
+    elige uno con pick_value), la lista de rdf:type y las demás
+    relaciones (p, o).
+    """
+    records = {}
+    for s, p, o in g:
+        rec = records.get(s)
+        if rec is None:
+            rec = records[s] = _new_record()
+        _add_triple(rec, p, o)
+    return records
+
+
+def build_entity(s, rec):
+    """Entidad (dict) a partir del registro de un sujeto, o None si no tiene label."""
+    fields = {f: pick_value(v) for f, v in rec["fields"].items()}
+    label = fields.get("label")
+    if not label:
+        return None  # solo entidades con label
+
+    comment = fields.get("comment")
+
+    # nuevas anotaciones textuales
+    desc_breve = fields.get("descripcionBreve")
+    desc_etno = fields.get("descripcionEtnografica")
+    fuente_txt = fields.get("fuenteTexto")
+    nivel = str(fields.get("nivelEmbeddings", "")).strip().upper()
+
+    types = [str(t) for t in rec["types"]]
+
+    # relaciones (para contexto estructural si luego lo quieres usar)
+    relations = [
+        {"property": str(p), "object": str(o)}
+        for p, o in rec["relations"]
+    ]
+
+    # texto agregado para embeddings
+    text_parts = [
+        str(label),
+        str(desc_breve) if desc_breve else "",
+        str(desc_etno) if desc_etno else "",
+        str(comment) if comment else "",
+    ]
+    full_text = " ".join(t for t in text_parts if t).strip()
+
+    return {
+        "uri": str(s),
+        "label": str(label),
+        "comment": str(comment) if comment else "",
+        "descripcionBreve": str(desc_breve) if desc_breve else "",
+        "descripcionEtnografica": str(desc_etno) if desc_etno else "",
+        "fuenteTexto": str(fuente_txt) if fuente_txt else "",
+        "nivelEmbeddings": nivel,   # "A" | "B" | "C" | "" (sin anotar)
+        "types": types,
+        "relations": relations,
+        "text": full_text,  # <- este es el que usarás para embeddings
+    }
+
+
+def simple_entity(e):
+    """Versión simple: lo mínimo para el índice."""
+    return {
+        "uri": e["uri"],
+        "label": e["label"],
+        "text": e["text"],  # para que build_index.py no tenga que recomponer nada
+        "nivelEmbeddings": e["nivelEmbeddings"],
+    }
+
+
+def print_summary(n, niveles, out, exp):
+    print(f"Extraídas {n} entidades.")
+    print("  Por nivel:", ", ".join(f"{k}={v}" for k, v in sorted(niveles.items())))
+    print(f"Guardado simple en: {out}")
+    print(f"Guardado expandido en: {exp}")
+
 
 def extract_entities():
-    g = Graph()
-    g.parse(TTL, format="turtle")
+    g = load_graph(TTL, SNAP)
 
     entities = {}
+    for s, rec in group_by_subject(g).items():
+        e = build_entity(s, rec)
+        if e is not None:
+            entities[str(s)] = e
 
-    for s in g.subjects():
-        label = g.value(s, RDFS.label)
-        if not label:
-            continue  # solo entidades con label
-
-        comment = g.value(s, RDFS.comment)
-
-        # nuevas anotaciones textuales
-        desc_breve = g.value(s, DESC_BREVE)
-        desc_etno = g.value(s, DESC_ETNO)
-        fuente_txt = g.value(s, FUENTE_TXT)
-
-        types = [str(t) for t in g.objects(s, RDF.type)]
-
-        # relaciones (para contexto estructural si luego lo quieres usar)
-        relations = []
-        for p, o in g.predicate_objects(s):
-            if p in (RDFS.label, RDFS.comment, RDF.type,
-                     DESC_BREVE, DESC_ETNO, FUENTE_TXT):
-                continue
-            relations.append({"property": str(p), "object": str(o)})
-
-        # texto agregado para embeddings
-        text_parts = [
-            str(label),
-            str(desc_breve) if desc_breve else "",
-            str(desc_etno) if desc_etno else "",
-            str(comment) if comment else "",
-        ]
-        full_text = " ".join(t for t in text_parts if t).strip()
-
-        entities[str(s)] = {
-            "uri": str(s),
-            "label": str(label),
-            "comment": str(comment) if comment else "",
-            "descripcionBreve": str(desc_breve) if desc_breve else "",
-            "descripcionEtnografica": str(desc_etno) if desc_etno else "",
-            "fuenteTexto": str(fuente_txt) if fuente_txt else "",
-            "types": types,
-            "relations": relations,
-            "text": full_text,  # <- este es el que usarás para embeddings
-        }
-
-    # versión simple: lo mínimo para el índice
-    simple_list = [
-        {
-            "uri": e["uri"],
-            "label": e["label"],
-            "text": e["text"],  # para que build_index.py no tenga que recomponer nada
-        }
-        for e in entities.values()
-    ]
+    # versión simple (sin nivel C: no debe aparecer en respuestas)
+    simple_list = [simple_entity(e) for e in entities.values() if e["nivelEmbeddings"] != "C"]
     os.makedirs(os.path.dirname(OUT), exist_ok=True)
     os.makedirs(os.path.dirname(EXP), exist_ok=True)
 
-    with open(OUT, "w", encoding="utf-8") as f:
-        json.dump(simple_list, f, indent=2, ensure_ascii=False)
-
-    with open(EXP, "w", encoding="utf-8") as f:
-        json.dump(list(entities.values()), f, indent=2, ensure_ascii=False)
-
-    print(f"Extraídas {len(entities)} entidades.")
-    print(f"Guardado simple en: {OUT}")
-    print(f"Guardado expandido en: {EXP}")
+    # .jsonl: una entidad por línea + índice de offsets (ver entity_store.py)
+    entity_store.write_entities(OUT, simple_list)
+    entity_store.write_entities(EXP, entities.values())
+
+    niveles = {}
+    for e in entities.values():
+        n = e["nivelEmbeddings"] or "sin nivel"
+        niveles[n] = niveles.get(n, 0) + 1
+    print_summary(len(entities), niveles, OUT, EXP)
+
+
+# ============================
+# Modo streaming (grafos grandes)
+# ============================
+
+def extract_entities_stream(source, chunk_mb=8):
+    """
+    Igual que extract_entities(), pero sin cargar el grafo: lee N-Triples
+    ordenado por sujeto (un .ttl se convierte antes, por trozos) y escribe
+    una entidad por línea en <entities>.jsonl y <expanded>.jsonl. La
+    memoria la fija la entidad más grande, no el grafo.
+    """
+    out, exp = entity_store.jsonl_path(OUT), entity_store.jsonl_path(EXP)
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    os.makedirs(os.path.dirname(exp), exist_ok=True)
+
+    # el .ttl convertido es temporal (junto al índice: puede ser grande)
+    with tempfile.TemporaryDirectory(prefix="kg-llm-nt-", dir=os.path.dirname(exp)) as tmp:
+        nt = source
+        if not source.endswith(".nt"):
+            nt = os.path.join(tmp, "sorted.nt")
+            n = triples_stream.turtle_to_sorted_ntriples(source, nt, chunk_bytes=chunk_mb * 2**20)
+            print(f"{source} -> N-Triples ordenado ({n} triples)")
+
+        niveles, n = {}, 0
+        with entity_store.JsonlWriter(out) as simple_f, entity_store.JsonlWriter(exp) as exp_f:
+            for s, pairs in triples_stream.group_by_subject_sorted(triples_stream.iter_ntriples(nt)):
+                rec = _new_record()
+                for p, o in pairs:
+                    _add_triple(rec, p, o)
+                e = build_entity(s, rec)
+                if e is None:
+                    continue
+                exp_f.write(e)
+                if e["nivelEmbeddings"] != "C":
+                    simple_f.write(simple_entity(e))
+                key = e["nivelEmbeddings"] or "sin nivel"
+                niveles[key] = niveles.get(key, 0) + 1
+                n += 1
+
+    print_summary(n, niveles, out, exp)
+    if (OUT, EXP) != (out, exp):
+        print("  (apunta paths.entities y paths.expanded a los .jsonl para usarlos en 02 y 03)")
 
 
 if __name__ == "__main__":
-    extract_entities()
+    parser = argparse.ArgumentParser(description="Extrae las entidades del grafo.")
+    parser.add_argument("--stream", nargs="?", const=TTL, metavar="ENTRADA",
+                        help="modo streaming: N-Triples ordenado (.nt) o Turtle (por defecto paths.ttl)")
+    parser.add_argument("--chunk-mb", type=int, default=8,
+                        help="tamaño de los trozos de Turtle al convertirlo (modo streaming)")
+    args = parser.parse_args()
+
+    if args.stream:
+        extract_entities_stream(args.stream, chunk_mb=args.chunk_mb)
+    else:
+        extract_entities()
@@ -1,31 +1,240 @@
-import json
+import hashlib
+import os
+import time
 import numpy as np
-from sentence_transformers import SentenceTransformer
 import yaml
 
+import ann
+import context_pack
+import embed_pool
+import entity_store
+import graph_expand
+import lexical
+import manifest
+import passages
+import vector_index
+
 cfg = yaml.safe_load(open("config.yaml"))
 
+TTL = cfg["paths"]["ttl"]
 ENT = cfg["paths"]["expanded"]
-OUT_VEC = cfg["paths"]["vectors"]
+OUT_VEC = cfg["paths"]["vectors"]   # enlace al build activo (ver manifest.py)
+KEEP_BUILDS = cfg.get("index", {}).get("keep_builds", 3)
+DTYPE = cfg.get("index", {}).get("dtype", "float32")   # float32 | float16 | int8
+IVF = cfg.get("index", {}).get("ivf", {})
+PASSAGES = cfg.get("index", {}).get("passages", {})
+ENCODE = cfg.get("index", {}).get("encode", {})        # procesos y tamaño de lote (embed_pool.py)
+BACKEND = cfg.get("retrieval", {}).get("backend", "exact")
+# nivel para las entidades sin :nivelEmbeddings (A = siempre, B = de respaldo)
+DEFAULT_TIER = cfg.get("index", {}).get("default_tier", "B")
+TIERS = ("A", "B")   # el nivel C no se indexa
+
+MODEL_PATH = cfg["model"]["path"]   # su tokenizador cuenta los tokens del contexto
+
+EMB_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# campos de la entidad que se embeben (quedan anotados en el manifest):
+# `text` (label + descripciones + comment, ver 01), el mismo que usan BM25,
+# los pasajes y el contexto; editar una descripción cambia el hash y re-embebe
+ENTITY_FIELDS = ("text",)
+
+
+def content_hash(text: str) -> str:
+    """Hash del texto a embeber (incluye el modelo: si cambia, todo se re-embebe)."""
+    return hashlib.sha1(f"{EMB_MODEL}\n{text}".encode("utf-8")).hexdigest()
+
+
+_model = None
+
+
+def get_model():
+    """El SentenceTransformer solo se carga si hay algo que codificar."""
+    global _model
+    if _model is None:
+        from sentence_transformers import SentenceTransformer
+        _model = SentenceTransformer(EMB_MODEL)
+    return _model
+
+
+def load_previous(path):
+    """
+    Devuelve {uri: (hash, vector)} del índice anterior, si existe y tiene hashes.
+    Índices antiguos sin hashes, o guardados con otro dtype, se ignoran
+    (se reconstruye todo).
+    """
+    marker = path if path.endswith(".npz") else os.path.join(path, "meta.json")
+    if not os.path.exists(marker):
+        return {}
+    prev = vector_index.load_index(path)
+    if prev.hashes is None or prev.meta.get("dtype") != DTYPE:
+        return {}
+    vectors = prev.rows(slice(None))
+    return {
+        uri: (h, vec)
+        for uri, h, vec in zip(prev.ids, prev.hashes, vectors)
+    }
+
+
+def tier_of(entity) -> str:
+    return entity.get("nivelEmbeddings") or DEFAULT_TIER
 
-model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
 
 # cargar entidades
-entities = json.load(open(ENT, "r", encoding="utf-8"))
+entities = entity_store.load_entities(ENT)   # .json o .jsonl (01 --stream)
+
+# particiones por nivel: se descarta C y se ordena A antes que B, así cada
+# nivel es un rango contiguo de filas y BM25 y el grafo quedan alineados con
+# los vectores. Dentro de cada nivel, por URI: el orden en que rdflib
+# recorre el grafo cambia entre ejecuciones y build_id depende del orden
+skipped = sum(1 for e in entities if tier_of(e) not in TIERS)
+entities = sorted((e for e in entities if tier_of(e) in TIERS),
+                  key=lambda e: (TIERS.index(tier_of(e)), e["uri"]))
+
+if not entities:
+    # sin filas no hay dimensión de los vectores ni nada que publicar
+    raise SystemExit(
+        f"❌ No hay entidades que indexar en {ENT} ({skipped} de nivel C). "
+        "Revisa el grafo o ejecuta 01_extract_entities.py."
+    )
+
+partitions = {}
+for i, e in enumerate(entities):
+    start, _ = partitions.get(tier_of(e), (i, i))
+    partitions[tier_of(e)] = [start, i + 1]
 
 texts = []
 ids = []
 
 for e in entities:
-    text = e["label"] + " " + e.get("comment", "")
+    text = " ".join(e.get(f, "") for f in ENTITY_FIELDS).strip()
     texts.append(text)
     ids.append(e["uri"])
 
-# generar embeddings
-vectors = model.encode(texts, convert_to_numpy=True)
+hashes = [content_hash(t) for t in texts]
+manifest.adopt_legacy(OUT_VEC)
+previous = load_previous(OUT_VEC)
+
+# solo se codifican las entidades nuevas o con texto modificado
+todo = [i for i, (uri, h) in enumerate(zip(ids, hashes))
+        if uri not in previous or previous[uri][0] != h]
+removed = len(set(previous) - set(ids))
+
+# pasajes de las descripciones largas: un vector por trozo (max-sim en 03_query.py)
+p_texts, p_owner, p_ids, p_embed, p_hashes, p_todo, p_previous = [], [], [], [], [], [], {}
+if PASSAGES.get("enabled", False):
+    max_words = PASSAGES.get("max_words", 60)
+    for row, e in enumerate(entities):
+        for j, chunk in enumerate(passages.split_passages(e.get("text", ""), max_words)):
+            p_texts.append(chunk)
+            p_owner.append(row)
+            p_ids.append(f"{e['uri']}|{j}")
+
+    p_embed = [entities[row]["label"] + ": " + chunk for row, chunk in zip(p_owner, p_texts)]
+    p_hashes = [content_hash(t) for t in p_embed]
+    p_previous = passages.load_previous(OUT_VEC, DTYPE)
+    p_todo = [i for i, h in enumerate(p_hashes) if h not in p_previous]
+
+# entidades y pasajes nuevos se codifican juntos, por lotes de longitud
+# parecida y (si son muchos) en varios procesos; ver embed_pool.py
+encoded = None
+if todo or p_todo:
+    t0 = time.perf_counter()
+    tmp_path = OUT_VEC.rstrip("/") + ".encode.npy"
+    encoded = np.array(embed_pool.encode(
+        [texts[i] for i in todo] + [p_embed[i] for i in p_todo],
+        EMB_MODEL, tmp_path, get_model,
+        workers=ENCODE.get("workers", 0), batch_size=ENCODE.get("batch_size", 32),
+    ))
+    os.remove(tmp_path)
+    encode_s = time.perf_counter() - t0
+
+vectors = [previous[uri][1] if uri in previous else None for uri in ids]
+for i, vec in zip(todo, encoded if encoded is not None else []):
+    vectors[i] = vec
+
+vectors = np.asarray(vectors, dtype=np.float32)
+
+# todo se escribe en un build nuevo; OUT_VEC sigue apuntando al anterior
+# hasta manifest.publish(), al final
+BUILD_DIR = manifest.new_build_dir(OUT_VEC, vector_index.build_id(hashes, DTYPE))
+
+# guardar: normalizado y en el dtype configurado, listo para np.memmap
+meta = vector_index.save_index(BUILD_DIR, vectors, ids, hashes, dtype=DTYPE, partitions=partitions)
+
+# adyacencia CSR de las relaciones entre entidades indexadas (expansión por grafo)
+adj = graph_expand.build_adjacency(ids, entities)
+graph_expand.save_adjacency(BUILD_DIR, *adj)
+
+# índice invertido BM25 sobre el campo `text` (búsqueda híbrida en 03_query.py)
+bm25 = lexical.build_bm25(BUILD_DIR, [e.get("text", "") for e in entities])
+
+if PASSAGES.get("enabled", False):
+    p_vectors = np.zeros((len(p_embed), vectors.shape[1]), dtype=np.float32)
+    for i, h in enumerate(p_hashes):
+        if h in p_previous:
+            p_vectors[i] = p_previous[h]
+    if p_todo:
+        p_vectors[p_todo] = encoded[len(todo):]
+
+    passages.save_passages(
+        BUILD_DIR, p_vectors, p_ids, p_hashes, p_owner, len(ids), p_texts,
+        entity_build_id=meta["build_id"], max_words=max_words, dtype=DTYPE,
+    )
+
+# tokens de la línea de contexto de cada fila (empaquetado en 03_query.py)
+try:
+    ctx_tokens = context_pack.count_tokens(
+        MODEL_PATH, [context_pack.context_line(e["label"], e.get("text", "")) for e in entities]
+    )
+    context_pack.save_token_counts(BUILD_DIR, ctx_tokens, MODEL_PATH)
+    if p_texts:
+        np.save(
+            os.path.join(BUILD_DIR, "passages", "ctx_tokens.npy"),
+            context_pack.count_tokens(MODEL_PATH, [
+                context_pack.context_line(entities[row]["label"], chunk)
+                for row, chunk in zip(p_owner, p_texts)
+            ]),
+        )
+except (ImportError, ValueError) as err:
+    ctx_tokens = None
+    print(f"⚠️  No se pudieron contar tokens del contexto ({err}); 03_query.py los contará al vuelo.")
+
+# motor aproximado, uno por nivel: sus parámetros quedan guardados junto al índice
+if BACKEND == "ivf":
+    built = ann.build_ivf_partitions(
+        vector_index.load_index(BUILD_DIR), BUILD_DIR,
+        nlist=IVF.get("nlist", 0), iters=IVF.get("iters", 10),
+    )
+    for tier, ivf in built.items():
+        print(f"IVF {tier} construido: nlist={ivf['nlist']}")
 
-# guardar correctamente
-np.savez(OUT_VEC, vectors=vectors, ids=np.array(ids))
+# manifest y cambio atómico del build activo
+build = manifest.write_manifest(
+    BUILD_DIR,
+    build_id=meta["build_id"],
+    encoder={"model": EMB_MODEL, "dim": meta["dim"], "dtype": meta["dtype"]},
+    text_recipe={
+        "entity": " + ".join(ENTITY_FIELDS),
+        "passage": f"label: trozo de text (≤ {PASSAGES.get('max_words', 60)} palabras)" if p_texts else None,
+    },
+    graph={"ttl": TTL, "sha1": manifest.file_sha1(TTL)},
+    entities={"file": ENT, "count": len(ids),
+              "ids_sha1": hashlib.sha1("\n".join(ids).encode("utf-8")).hexdigest()},
+)
+manifest.publish(OUT_VEC, BUILD_DIR, keep=KEEP_BUILDS)
 
 print("Índice generado con:", len(ids), "entidades.")
-print("Guardado en:", OUT_VEC)
+print(f"  Re-embebidas: {len(todo)}  Reutilizadas: {len(ids) - len(todo)}  Eliminadas: {removed}")
+if encoded is not None:
+    print(f"  Codificación: {len(encoded)} textos en {encode_s:.1f} s ({len(encoded) / encode_s:.1f}/s)")
+print(f"  Formato: {meta['dtype']}  dim={meta['dim']}")
+print("  Niveles: " + "  ".join(f"{t}={b - a}" for t, (a, b) in partitions.items())
+      + f"  (C, no indexadas: {skipped})")
+print(f"  Grafo: {len(adj[1])} aristas (con inversas), {len(adj[3])} tipos")
+print(f"  BM25: {bm25['terms']} términos, {bm25['postings']} postings")
+if p_texts:
+    print(f"  Pasajes: {len(p_texts)} de {len(set(p_owner))} entidades largas "
+          f"(re-embebidos: {len(p_todo)})")
+if ctx_tokens is not None:
+    print(f"  Contexto: {int(ctx_tokens.sum())} tokens en total, máx. {int(ctx_tokens.max(initial=0))} por entidad")
+print(f"Guardado en: {BUILD_DIR}\n  {OUT_VEC} -> build {build['version']}")
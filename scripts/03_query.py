@@ -6,16 +6,36 @@
 #
 # Uso:
 #   python3 scripts/03_query.py "¿Quién es el Ukuku?"
-
-import json
+#
+# Modo servidor (mantiene índice y modelos cargados entre preguntas):
+#   python3 scripts/03_query.py --serve
+#
+# Si hay un servidor escuchando en server.host:server.port, el uso normal
+# de arriba le envía la pregunta en lugar de cargar todo de nuevo.
+# Con --local se fuerza la carga en este proceso.
+
+import argparse
+import atexit
+import os
+import pickle
+import threading
+import time
 import yaml
 import numpy as np
-import sys
 import warnings
 
-from sentence_transformers import SentenceTransformer
-import llama_cpp
-from llama_cpp import Llama
+import ann
+import caches
+import context_pack
+import encoders
+import entity_store
+import graph_expand
+import lexical
+import manifest
+import passages
+import query_server
+import scheduler
+import vector_index
 
 # Silenciar algunos warnings molestos
 warnings.filterwarnings("ignore", category=UserWarning)
@@ -27,8 +47,6 @@ def _safe_del(self):
     # La memoria se libera al terminar el proceso.
     pass
 
-llama_cpp.Llama.__del__ = _safe_del
-
 # ============================
 # 1. Cargar configuración
 # ============================
@@ -36,206 +54,741 @@ llama_cpp.Llama.__del__ = _safe_del
 CFG = yaml.safe_load(open("config.yaml", encoding="utf-8"))
 
 TTL_FILE    = CFG["paths"]["ttl"]              # no se usa aún, pero queda para futuro
-ENT_FILE    = CFG["paths"]["entities"]         # index/entities.json (simple)
-INDEX_FILE  = CFG["paths"]["index"]            # index/index.npz
+ENT_FILE    = CFG["paths"]["entities"]         # index/entities.jsonl (simple)
+INDEX_FILE  = CFG["paths"]["index"]            # index/vectores -> build activo (ver manifest.py)
 
 MODEL_PATH    = CFG["model"]["path"]
 MODEL_CTX     = CFG["model"].get("ctx", 2048)
 MODEL_THREADS = CFG["model"].get("threads", 4)
-
-TOP_K = 5  # número de entidades a recuperar para el contexto
+# trabajadores de llama.cpp en modo servidor: 1 = latencia (1×4 hilos),
+# 2 o 4 = rendimiento (2×2, 4×1); los hilos de model.threads se reparten
+MODEL_WORKERS = CFG["model"].get("workers", 1)
+
+# codificador de consultas (ver encoders.py): sentence_transformers | onnx (sin PyTorch)
+EMBEDDINGS = CFG.get("embeddings", {})
+EMB_MODEL = encoders.encoder_id(EMBEDDINGS)
+
+CACHE_CFG = CFG.get("cache", {})
+CACHE_DIR = CACHE_CFG.get("dir", os.path.join(os.path.dirname(INDEX_FILE), "cache"))
+
+SERVER_HOST = CFG.get("server", {}).get("host", "127.0.0.1")
+SERVER_PORT = CFG.get("server", {}).get("port", 8765)
+# cada cuánto el servidor mira si hay un build nuevo del índice (0 = solo con /reload)
+RELOAD_CHECK_S = CFG.get("server", {}).get("reload_check_s", 5)
+# micro-lotes de recuperación y cola del LLM con varias peticiones a la vez (ver scheduler.py)
+SCHEDULER = CFG.get("server", {}).get("scheduler", {})
+
+RETRIEVAL = CFG.get("retrieval", {})
+TOP_K = RETRIEVAL.get("top_k", 5)  # número de entidades a recuperar para el contexto
+EXPAND = RETRIEVAL.get("expand", {})  # expansión por vecinos del grafo (ver graph_expand.py)
+HYBRID = RETRIEVAL.get("hybrid", {})  # fusión con BM25 (ver lexical.py)
+USE_PASSAGES = CFG.get("index", {}).get("passages", {}).get("enabled", False)
+PASSAGES_PER_ENTITY = RETRIEVAL.get("passages_per_entity", 2)
+
+# Parámetros de generación (también forman parte de la clave de la caché de respuestas)
+GEN_PARAMS = {
+    "max_tokens": 256,
+    "temperature": 0.25,
+    "top_k": 40,
+    "top_p": 0.9,
+    "repeat_penalty": 1.3,  # clave para evitar repeticiones
+}
 
 
 # ============================
-# 2. Utilidades
+# 2. Carga de datos y modelos
 # ============================
+#
+# Se cargan una sola vez por proceso. En modo servidor quedan residentes
+# y cada pregunta solo paga retrieve() + ask_llm().
+
+uri_to_entity = {}
+INDEX_DIR = None        # directorio real del build activo (paths.index es un enlace)
+BUILD = None            # su manifest.json (ver manifest.py)
+INDEX_LOCK = threading.Lock()   # cambio de build vs. retrieve() + contexto
+ANSWER_LOCK = threading.Lock()  # answer_cache desde varios trabajadores del LLM
+_last_index_check = 0.0
+_rejected_builds = {}   # build_dir -> problemas (no se vuelve a cargar cada vez)
+VEC, IDS = None, []     # VEC: vector_index.VectorIndex (mmap, ya normalizado)
+SEARCH = None           # motor de búsqueda (ann.ExactSearch / ann.IVFSearch)
+ADJ = None              # graph_expand.Adjacency (CSR) o None
+EDGE_WEIGHTS = None     # peso por tipo de arista, alineado con ADJ.names
+BM25 = None             # lexical.BM25 o None
+PASSAGES = None         # passages.PassageIndex o None
+emb_model = None        # encoders.*Encoder; se carga al primer fallo de la caché de consultas
+llm = None              # LLMS[0]; también tokeniza para contexto y prompt
+LLMS = []               # un Llama por trabajador, todos sobre el mismo .gguf mapeado
+query_cache = None      # caches.LRUCache: consulta normalizada -> embedding
+answer_cache = None     # caches.LRUCache: (consulta, contexto, parámetros) -> respuesta
+SCHED = None            # scheduler.Scheduler (solo en modo servidor)
+PREFIX_TOKENS = []      # tokens de PROMPT_PREFIX, ya evaluados en el KV cache del LLM
+TOKEN_COUNT = {}        # URI -> tokens de su línea de contexto (ver context_pack.py)
+
+
+def load_resources(llm_workers: int = 1):
+    load_retrieval()
+    load_llm(llm_workers)
+
+
+def _open_build(build_dir: str) -> dict:
+    """Carga todo lo que usa retrieve() desde un build, sin tocar los globales."""
+    vec = vector_index.load_index(build_dir)
+    state = {
+        "INDEX_DIR": build_dir,
+        "BUILD": manifest.load_manifest(build_dir),
+        # entities.jsonl viene de 01_extract_entities.py; solo se leen del
+        # disco las entidades que salen en los resultados
+        "uri_to_entity": entity_store.open_entities(ENT_FILE),
+        "VEC": vec,
+        "IDS": vec.ids,
+        "SEARCH": ann.load_search(
+            vec, build_dir,
+            backend=RETRIEVAL.get("backend", "exact"),
+            nprobe=RETRIEVAL.get("nprobe", 8),
+            tier_threshold=RETRIEVAL.get("tier_threshold", 0.0),
+        ),
+        "BM25": lexical.load_bm25(build_dir) if HYBRID.get("enabled", False) else None,
+        "PASSAGES": passages.load_passages(build_dir, vec.meta.get("build_id")) if USE_PASSAGES else None,
+        "ADJ": graph_expand.load_adjacency(build_dir) if EXPAND.get("hops", 0) > 0 else None,
+        "EDGE_WEIGHTS": None,
+        "TOKEN_COUNT": {},
+    }
+    if state["ADJ"] is not None:
+        state["EDGE_WEIGHTS"] = state["ADJ"].type_weights(
+            EXPAND.get("weights", {}), EXPAND.get("default_weight", 0.7)
+        )
+    counts = context_pack.load_token_counts(build_dir, MODEL_PATH)
+    if counts is not None:
+        state["TOKEN_COUNT"] = dict(zip(vec.ids, counts.tolist()))
+    return state
+
+
+def _check_build(state: dict) -> list:
+    """Problemas del build según su manifest (ver manifest.validate)."""
+    dim = None
+    if emb_model is not None:
+        dim = int(emb_model.encode(["dimensión"]).shape[1])
+    return manifest.validate(
+        state["BUILD"], state["VEC"].meta, state["IDS"], state["uri_to_entity"],
+        encoders.EMB_MODEL, dim,
+    )
+
 
-def load_index(path_npz):
+def load_retrieval():
+    """Entidades, índice y motores de búsqueda: todo lo que usa retrieve()."""
+    global query_cache, _last_index_check
+
+    print("📦 Cargando entidades e índice de embeddings...")
+    state = _open_build(manifest.current(INDEX_FILE))
+    for problem in _check_build(state):
+        print(f"⚠️  {problem}")
+    with INDEX_LOCK:
+        globals().update(state)
+    _last_index_check = time.monotonic()
+
+    query_cache = caches.LRUCache(
+        CACHE_CFG.get("query_embeddings", 5000),
+        os.path.join(CACHE_DIR, "query_embeddings.pkl"),
+    )
+    atexit.register(query_cache.save)
+
+
+def reload_index() -> dict:
     """
-    Carga embeddings y URIs desde el archivo .npz.
-    Soporta diferentes nombres de clave ('vectors'/'embeddings', 'ids'/'uris').
+    Si paths.index apunta a otro build (02_build_index.py terminó uno
+    nuevo), lo carga, lo valida con su manifest y lo cambia en caliente.
+    El LLM y las cachés de consultas se conservan.
     """
-    data = np.load(path_npz)
-    keys = list(data.files)
+    global _last_index_check
+    _last_index_check = time.monotonic()
+    build_dir = manifest.current(INDEX_FILE)
+    version = (BUILD or {}).get("version")
+    if build_dir == INDEX_DIR:
+        return {"swapped": False, "version": version}
+    if build_dir in _rejected_builds:
+        return {"swapped": False, "version": version, **_rejected_builds[build_dir]}
+
+    state = _open_build(build_dir)
+    problems = _check_build(state)
+    new_version = (state["BUILD"] or {}).get("version", build_dir)
+    if problems:
+        print(f"⚠️  Build {new_version} rechazado: " + "; ".join(problems))
+        _rejected_builds[build_dir] = {"rejected": new_version, "problems": problems}
+        return {"swapped": False, "version": version, **_rejected_builds[build_dir]}
+
+    with INDEX_LOCK:
+        globals().update(state)
+    if answer_cache is not None:
+        with ANSWER_LOCK:      # los trabajadores del LLM pueden estar guardando respuestas
+            answer_cache.set_stamp(data_stamp())
+    print(f"🔄 Índice cambiado en caliente: {version} -> {new_version}")
+    return {"swapped": True, "version": new_version, "previous": version}
+
+
+def maybe_reload_index():
+    """reload_index() como mucho cada server.reload_check_s segundos (0 = nunca)."""
+    if RELOAD_CHECK_S > 0 and time.monotonic() - _last_index_check >= RELOAD_CHECK_S:
+        reload_index()
+
+
+def load_llm(workers: int = 1):
+    """
+    Modelo local y caché de respuestas. Con workers > 1 se crean varias
+    instancias de Llama sobre el mismo .gguf: llama.cpp lo abre con mmap,
+    así que los pesos están una sola vez en memoria (page cache) y cada
+    trabajador solo añade su contexto (KV cache) y sus hilos.
+    """
+    global llm, LLMS, answer_cache, PREFIX_TOKENS
 
-    # vectores
-    if "vectors" in keys:
-        vectors = data["vectors"]
-    elif "embeddings" in keys:
-        vectors = data["embeddings"]
-    else:
-        raise KeyError(
-            f"No se encontraron claves 'vectors' ni 'embeddings' en {path_npz}. "
-            f"Claves disponibles: {keys}"
-        )
+    # Importaciones pesadas aquí, para que el modo cliente no las pague.
+    import llama_cpp
+    from llama_cpp import Llama
 
-    # identificadores
-    if "ids" in keys:
-        ids = data["ids"]
-    elif "uris" in keys:
-        ids = data["uris"]
-    else:
-        raise KeyError(
-            f"No se encontraron claves 'ids' ni 'uris' en {path_npz}. "
-            f"Claves disponibles: {keys}"
+    llama_cpp.Llama.__del__ = _safe_del
+
+    # Las respuestas dependen del índice y del texto de las entidades:
+    # si cualquiera de los dos se regenera, la caché se invalida sola.
+    answer_cache = caches.LRUCache(
+        CACHE_CFG.get("answers", 500),
+        os.path.join(CACHE_DIR, "answers.pkl"),
+        stamp=data_stamp(),
+    )
+    atexit.register(answer_cache.save)
+
+    threads = max(1, MODEL_THREADS // workers)
+    print(f"🤖 Cargando modelo LLM local ({workers}×{threads} hilos)...")
+    LLMS = [
+        Llama(
+            model_path=MODEL_PATH,
+            n_ctx=MODEL_CTX,
+            n_threads=threads,
+            use_mmap=True,         # pesos compartidos entre trabajadores
+            verbose=False,         # para que no imprima métricas de tiempo
         )
+        for _ in range(workers)
+    ]
+    llm = LLMS[0]
+    # el primero evalúa (o carga) el prefijo y lo guarda; los demás cargan ese estado
+    for model in LLMS:
+        PREFIX_TOKENS = warm_prefix(model)
 
-    return vectors, ids.tolist()
 
+# ============================
+# 3. Recuperación semántica
+# ============================
 
-def normalize(vectors: np.ndarray) -> np.ndarray:
-    """Normaliza cada fila de una matriz de vectores (para usar producto punto como coseno)."""
-    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
-    norms[norms == 0.0] = 1.0
-    return vectors / norms
+def _make_results(idxs, scores, vias=None, q_vec=None):
+    """
+    Convierte filas del índice + scores en los dicts de resultado. Las
+    entidades con pasajes llevan solo los trozos más cercanos a q_vec.
+    """
+    results = []
+    for k, (i, score) in enumerate(zip(idxs, scores)):
+        uri = IDS[i]
+        score = float(score)
+        ent = uri_to_entity.get(uri, {"uri": uri, "label": uri, "text": ""})
+        r = {
+            "uri": uri,
+            "score": score,
+            "label": ent.get("label", uri),
+            "text": ent.get("text", ""),
+        }
+        pids = None
+        if PASSAGES is not None and q_vec is not None:
+            pids = PASSAGES.select(int(i), q_vec, PASSAGES_PER_ENTITY)
+        if pids:
+            r["text"] = PASSAGES.text(pids)
+            r["passages"] = pids
+        if vias is not None and vias[k] is not None:
+            # llegó por expansión del grafo: desde qué entidad y por qué relación
+            parent, edge = vias[k]
+            r["via"] = {"uri": IDS[parent], "relation": edge}
+        results.append(r)
+    return results
 
 
-# ============================
-# 3. Carga de datos y modelos
-# ============================
+def _reach(idxs, scores) -> int:
+    """Filas [0, reach) que consultó la búsqueda densa (con niveles, quizá solo A)."""
+    reach = getattr(SEARCH, "reach", None)
+    return reach(idxs, scores) if reach is not None else len(IDS)
 
-print("📘 Cargando entidades...")
-entities = json.load(open(ENT_FILE, encoding="utf-8"))
-uri_to_entity = {e["uri"]: e for e in entities}   # entities.json viene de 01_extract_entities.py
 
-print("📦 Cargando índice de embeddings...")
-VEC, IDS = load_index(INDEX_FILE)
-VEC = normalize(VEC)
+def _search_many(queries: list, Q: np.ndarray, top_k: int) -> list:
+    """
+    Búsqueda vectorial + (opcional) max-sim con los pasajes + (opcional)
+    fusión con BM25 + (opcional) expansión por vecinos del grafo.
+    La parte densa va por lotes (search_many y un producto matriz-matriz
+    con los pasajes); BM25 y la expansión se resuelven consulta a consulta.
+    Pasajes y BM25 solo miran los niveles que consultó la búsqueda densa.
+    """
+    hybrid = BM25 is not None or PASSAGES is not None
+    pool = max(top_k, HYBRID.get("pool", 20)) if hybrid else top_k
+    all_idxs, all_scores = SEARCH.search_many(Q, pool)
+    if hybrid:
+        reach = [_reach(i, s) for i, s in zip(all_idxs, all_scores)]
+    if PASSAGES is not None:
+        all_idxs, all_scores = PASSAGES.max_sim_many(Q, all_idxs, all_scores, pool, limits=reach)
+
+    out = []
+    for k, (query, q_vec, idxs, scores) in enumerate(zip(queries, Q, all_idxs, all_scores)):
+        if BM25 is not None:
+            lex = BM25.scores(query)
+            lex[reach[k]:] = 0.0
+            idxs, scores = lexical.fuse(
+                VEC, q_vec, idxs, scores, lex,
+                pool=pool, weight=HYBRID.get("weight", 0.3),
+            )
+        idxs, scores = idxs[:top_k], scores[:top_k]
+
+        if ADJ is None:
+            out.append(_make_results(idxs, scores, q_vec=q_vec))
+            continue
+        idxs, scores, vias = graph_expand.expand(
+            ADJ, VEC, q_vec, idxs, scores, top_k,
+            hops=EXPAND.get("hops", 1),
+            alpha=EXPAND.get("alpha", 0.5),
+            weights=EDGE_WEIGHTS,
+        )
+        out.append(_make_results(idxs, scores, vias, q_vec))
+    return out
 
-print("🧠 Cargando modelo de embeddings (SentenceTransformer)...")
-emb_model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
 
-print("🤖 Cargando modelo LLM local...")
-llm = Llama(
-    model_path=MODEL_PATH,
-    n_ctx=MODEL_CTX,
-    n_threads=MODEL_THREADS,
-    verbose=False,         # para que no imprima métricas de tiempo
-)
+def data_stamp() -> str:
+    """Identifica el build actual de índice + entidades."""
+    st = os.stat(ENT_FILE)
+    return caches.stable_hash([VEC.meta.get("build_id"), st.st_size, st.st_mtime_ns])
 
 
-# ============================
-# 4. Recuperación semántica
-# ============================
+def get_emb_model():
+    """Carga el codificador de consultas solo cuando hace falta codificar algo."""
+    global emb_model
+    if emb_model is None:
+        print(f"🧠 Cargando modelo de embeddings ({EMBEDDINGS.get('backend', 'sentence_transformers')})...")
+        emb_model = encoders.load_encoder(EMBEDDINGS)
+    return emb_model
+
+
+def encode_queries(queries: list) -> np.ndarray:
+    """
+    Embeddings normalizados de las consultas. Los que ya están en la caché
+    no pasan por el transformer; el resto se codifica en un solo lote.
+    """
+    keys = [(EMB_MODEL, caches.normalize_query(q)) for q in queries]
+    vecs = [query_cache.get(k) for k in keys]
+
+    missing = [i for i, v in enumerate(vecs) if v is None]
+    if missing:
+        new = get_emb_model().encode([queries[i] for i in missing])   # ya normalizados
+        for i, v in zip(missing, new.astype(np.float32)):
+            vecs[i] = v
+            query_cache.put(keys[i], v)
+
+    return np.stack(vecs)
+
 
 def retrieve(query: str, top_k: int = TOP_K):
     """
     Devuelve las top_k entidades más cercanas a la consulta,
     con score de similitud y metadatos.
     """
-    q_vec = emb_model.encode(query, convert_to_numpy=True)
-    q_vec = q_vec / (np.linalg.norm(q_vec) + 1e-9)
+    return retrieve_many([query], top_k)[0]
 
-    scores = VEC @ q_vec  # coseno porque todo está normalizado
-    idxs = np.argsort(-scores)[:top_k]
 
-    results = []
-    for i in idxs:
-        uri = IDS[i]
-        score = float(scores[i])
-        ent = uri_to_entity.get(uri, {"uri": uri, "label": uri, "text": ""})
-        results.append(
-            {
-                "uri": uri,
-                "score": score,
-                "label": ent.get("label", uri),
-                "text": ent.get("text", ""),
-            }
-        )
-    return results
+def retrieve_many(queries: list, top_k: int = TOP_K):
+    """
+    Igual que retrieve() para una lista de consultas: un solo encode()
+    por lotes y un producto matriz-matriz. Devuelve una lista de
+    resultados por consulta, en el mismo orden.
+    """
+    if not queries:
+        return []
+    Q = encode_queries(list(queries))
 
+    # coseno porque todo está normalizado; solo se ordenan los top_k
+    return _search_many(list(queries), Q, top_k)
 
-def build_context(results):
+
+def context_budget(query: str) -> int:
+    """Tokens disponibles para el contexto: n_ctx - max_tokens - resto del prompt."""
+    return MODEL_CTX - GEN_PARAMS["max_tokens"] - len(prompt_tokens(query, ""))
+
+
+def _line_tokens(key, line: str) -> int:
+    """Tokens de una línea; key es la URI o (URI, pasajes)."""
+    n = TOKEN_COUNT.get(key)
+    if n is None:
+        # índice sin conteos (o de otro modelo): se cuenta una vez y se recuerda
+        n = TOKEN_COUNT[key] = len(llm.tokenize(line.encode("utf-8"), add_bos=False)) + 1
+    return n
+
+
+def build_context(results, query: str = ""):
     """
     Construye el texto de contexto a partir de las entidades recuperadas.
     - Elimina duplicados por URI.
-    - Limita el número de líneas para evitar repetición.
+    - Llena el presupuesto de tokens del prompt en orden de score; la
+      primera entidad que no cabe entera se recorta.
     """
     seen = set()
-    lines = []
+    lines, counts = [], []
 
     for r in results:
         if r["uri"] in seen:
             continue
         seen.add(r["uri"])
 
-        label = r["label"]
-        text = r.get("text", "")
-        line = f"- {label}: {text}"
+        line = context_pack.context_line(r["label"], r.get("text", ""))
         lines.append(line)
+        pids = r.get("passages")
+        if pids and PASSAGES.tokens is not None:
+            # cada trozo se contó con su etiqueta: la suma sobrestima un poco
+            counts.append(int(PASSAGES.tokens[pids].sum()))
+        else:
+            counts.append(_line_tokens((r["uri"], tuple(pids)) if pids else r["uri"], line))
 
-    # limitar a máximo 5 entradas en el contexto
-    return "\n".join(lines[:5])
+    return context_pack.pack(lines, counts, context_budget(query))
 
 
 # ============================
-# 5. Llamada al LLM local
+# 4. Llamada al LLM local
 # ============================
 
+# Parte fija del prompt: se tokeniza y evalúa una sola vez. llama.cpp
+# reutiliza el KV cache del prefijo común más largo con la llamada anterior,
+# así que cada pregunta solo evalúa el contexto y la pregunta.
+PROMPT_PREFIX = (
+    "Eres un asistente experto en festividades andinas, personajes rituales "
+    "y patrimonio cultural.\n"
+    "Responde en español, con precisión y SIN repetir frases.\n"
+    "Si el contexto es redundante, sintetiza la información.\n\n"
+    "Contexto:\n"
+)
+
+
+def build_prompt(query: str, context: str) -> str:
+    return (
+        PROMPT_PREFIX +
+        f"{context}\n\n"
+        "Pregunta:\n"
+        f"{query}\n\n"
+        "Respuesta (máximo 5 líneas, clara y sin repeticiones):\n"
+    )
+
+
+def prompt_tokens(query: str, context: str) -> list:
+    """
+    Tokens del prompt: PREFIX_TOKENS + parte dinámica tokenizada aparte,
+    para que el prefijo sea idéntico token a token en todas las llamadas.
+    """
+    dynamic = build_prompt(query, context)[len(PROMPT_PREFIX):]
+    return PREFIX_TOKENS + llm.tokenize(dynamic.encode("utf-8"), add_bos=False)
+
+
+def warm_prefix(model) -> list:
+    """
+    Evalúa PROMPT_PREFIX y deja su estado en el KV cache del modelo. El
+    estado se guarda en CACHE_DIR y se reutiliza en el próximo arranque
+    mientras no cambien el modelo, el contexto ni el texto del prefijo.
+    """
+    tokens = model.tokenize(PROMPT_PREFIX.encode("utf-8"))
+    path = os.path.join(CACHE_DIR, "prompt_prefix.state")
+    stamp = caches.stable_hash({
+        "model": os.path.basename(MODEL_PATH),
+        "mtime": os.path.getmtime(MODEL_PATH) if os.path.exists(MODEL_PATH) else None,
+        "ctx": MODEL_CTX,
+        "prefix": PROMPT_PREFIX,
+    })
+
+    try:
+        with open(path, "rb") as f:
+            saved = pickle.load(f)
+        if saved.get("stamp") == stamp:
+            model.load_state(saved["state"])
+            return tokens
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        pass  # no hay estado guardado (o es ilegible): se evalúa de nuevo
+
+    model.reset()
+    model.eval(tokens)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump({"stamp": stamp, "state": model.save_state()}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+    return tokens
+
+
+def ask_llm_stream(query: str, context: str, worker: int = 0):
+    """
+    Versión en streaming de ask_llm(): genera eventos a medida que
+    llama.cpp produce tokens.
+      {"token": "..."}                          uno por token
+      {"done": True, "answer": ..., "metrics": {...}}   al final
+    Las métricas separan la evaluación del prompt (prompt_eval_s), el
+    tiempo hasta el primer token (ttft_s, que la incluye) y la generación
+    posterior (gen_s, tokens/s). `worker` elige la instancia de LLMS.
+    """
+    key = caches.stable_hash({
+        "query": caches.normalize_query(query),
+        "context": caches.stable_hash(context),
+        "params": GEN_PARAMS,
+        "model": os.path.basename(MODEL_PATH),
+    })
+    with ANSWER_LOCK:      # varios trabajadores comparten la caché
+        cached = answer_cache.get(key)
+    if cached is not None:
+        yield {"token": cached}
+        yield {"done": True, "answer": cached, "metrics": {"cached": True}}
+        return
+
+    tokens = prompt_tokens(query, context)
+    model = LLMS[worker]
+
+    # llama-cpp-python evalúa el prompt (lo que no esté ya en el KV cache)
+    # con una llamada a eval() antes de muestrear el primer token; luego una
+    # por token. Se cronometra la primera en la instancia de este trabajador.
+    eval_s = []
+
+    def timed_eval(toks):
+        t = time.perf_counter()
+        type(model).eval(model, toks)
+        eval_s.append(time.perf_counter() - t)
+
+    t0 = time.perf_counter()
+    t_first = None
+    n_tokens = 0
+    pieces = []
+
+    model.eval = timed_eval
+    try:
+        for chunk in model(tokens, **GEN_PARAMS, stop=["\n\n", "</s>"], stream=True):
+            text = chunk["choices"][0]["text"]
+            if t_first is None:
+                t_first = time.perf_counter()
+            n_tokens += 1
+            pieces.append(text)
+            yield {"token": text}
+    finally:
+        del model.eval
+
+    t_end = time.perf_counter()
+    answer = "".join(pieces).strip()
+    with ANSWER_LOCK:
+        answer_cache.put(key, answer)
+
+    ttft = (t_first or t_end) - t0
+    gen_time = t_end - (t_first or t_end)
+    yield {
+        "done": True,
+        "answer": answer,
+        "metrics": {
+            "cached": False,
+            "worker": worker,
+            "prompt_tokens": len(tokens),
+            "prefix_tokens": len(PREFIX_TOKENS),
+            "prompt_eval_s": round(eval_s[0], 4) if eval_s else 0.0,
+            "ttft_s": round(ttft, 4),
+            "gen_s": round(gen_time, 4),
+            "completion_tokens": n_tokens,
+            "tokens_per_s": round((n_tokens - 1) / gen_time, 2) if n_tokens > 1 and gen_time > 0 else 0.0,
+            "total_s": round(t_end - t0, 4),
+        },
+    }
+
+
+def _answer(events) -> str:
+    for event in events:
+        if event.get("done"):
+            return event["answer"]
+    return ""
+
+
 def ask_llm(query: str, context: str) -> str:
     """
     Llama al modelo local con un prompt estilo RAG.
     Se fuerza a:
       - no repetir frases
       - responder breve
+    Si la misma pregunta ya se respondió con el mismo contexto y los mismos
+    parámetros, se devuelve la respuesta guardada sin pasar por el LLM.
     """
-    prompt = (
-        "Eres un asistente experto en festividades andinas, personajes rituales "
-        "y patrimonio cultural.\n"
-        "Responde en español, con precisión y SIN repetir frases.\n"
-        "Si el contexto es redundante, sintetiza la información.\n\n"
-        "Contexto:\n"
-        f"{context}\n\n"
-        "Pregunta:\n"
-        f"{query}\n\n"
-        "Respuesta (máximo 5 líneas, clara y sin repeticiones):\n"
-    )
+    return _answer(ask_llm_stream(query, context))
+
 
-    out = llm(
-        prompt,
-        max_tokens=256,
-        temperature=0.25,
-        top_k=40,
-        top_p=0.9,
-        repeat_penalty=1.3,  # clave para evitar repeticiones
-        stop=["\n\n", "</s>"],
+def format_metrics(m: dict) -> str:
+    if m.get("cached"):
+        return "⏱️  respuesta desde caché"
+    return (
+        f"⏱️  TTFT {m['ttft_s']:.2f} s · {m['tokens_per_s']:.1f} tok/s · "
+        f"prompt {m['prompt_tokens']} tok ({m.get('prefix_tokens', 0)} del prefijo ya evaluados) "
+        f"en {m.get('prompt_eval_s', 0.0):.2f} s · "
+        f"{m['completion_tokens']} tok generados"
     )
 
-    if isinstance(out, dict) and "choices" in out:
-        return out["choices"][0]["text"].strip()
 
-    return str(out).strip()
+# ============================
+# 5. Modo servidor
+# ============================
+
+def retrieve_with_context(queries: list, top_k: int) -> list:
+    """
+    Un lote de consultas del planificador -> [{"results", "context"}].
+    Corre en su hilo de recuperación, el mismo que cambia de build.
+    """
+    maybe_reload_index()
+    with INDEX_LOCK:
+        # el contexto se empaqueta aquí: el cliente no tiene el tokenizador
+        return [
+            {"results": results, "context": build_context(results, query)}
+            for query, results in zip(queries, retrieve_many(queries, top_k))
+        ]
+
+
+def _retrieve_many_now(queries: list, top_k: int) -> list:
+    maybe_reload_index()
+    with INDEX_LOCK:
+        return retrieve_many(queries, top_k)
+
+
+def _endpoint_retrieve(payload: dict) -> dict:
+    return SCHED.retrieve(payload["query"], int(payload.get("top_k", TOP_K)))
+
+
+def _endpoint_retrieve_many(payload: dict) -> dict:
+    top_k = int(payload.get("top_k", TOP_K))
+    return {"results": SCHED.run_cpu(_retrieve_many_now, list(payload["queries"]), top_k)}
+
+
+def _endpoint_ask(payload: dict) -> dict:
+    return {"answer": _answer(SCHED.ask_stream(payload["query"], payload.get("context", "")))}
+
+
+def _endpoint_ask_stream(payload: dict):
+    # Devuelve un generador: el servidor lo envía como NDJSON, línea a línea.
+    return SCHED.ask_stream(payload["query"], payload.get("context", ""))
+
+
+def _endpoint_query(payload: dict) -> dict:
+    # Pregunta completa en una sola llamada: recuperación + contexto + respuesta.
+    out = SCHED.retrieve(payload["query"], int(payload.get("top_k", TOP_K)))
+    out["answer"] = _answer(SCHED.ask_stream(payload["query"], out["context"]))
+    return out
+
+
+def _endpoint_stats(payload: dict) -> dict:
+    return {
+        "index": (BUILD or {}).get("version"),
+        "query_cache": query_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "scheduler": SCHED.stats(),
+    }
+
+
+def _endpoint_reload(payload: dict) -> dict:
+    return SCHED.run_cpu(reload_index)
+
+
+def run_server(host: str, port: int):
+    global SCHED
+    load_resources(llm_workers=MODEL_WORKERS)
+    SCHED = scheduler.Scheduler(
+        retrieve_with_context, ask_llm_stream,
+        max_batch=SCHEDULER.get("max_batch", 16),
+        max_wait_ms=SCHEDULER.get("max_wait_ms", 10),
+        llm_queue=SCHEDULER.get("llm_queue", 4),
+        llm_timeout_s=SCHEDULER.get("llm_timeout_s", 120),
+        llm_workers=len(LLMS),
+    )
+    query_server.serve(
+        {
+            "/retrieve": _endpoint_retrieve,
+            "/retrieve_many": _endpoint_retrieve_many,
+            "/ask": _endpoint_ask,
+            "/ask_stream": _endpoint_ask_stream,
+            "/query": _endpoint_query,
+            "/stats": _endpoint_stats,
+            "/reload": _endpoint_reload,
+        },
+        host,
+        port,
+        threaded=True,   # peticiones concurrentes: las ordena el planificador
+    )
 
 
 # ============================
 # 6. Entrada principal
 # ============================
 
-def main():
-    if len(sys.argv) > 1:
-        query = " ".join(sys.argv[1:])
-    else:
-        query = input("❓ Escribe tu pregunta (Ctrl+C para salir): ").strip()
-
-    if not query:
-        print("No se ingresó ninguna pregunta.")
-        return
-
+def answer_query(query: str, remote: bool, host: str, port: int):
+    """Flujo de una pregunta: local (modelos en este proceso) o contra el servidor."""
     print("\n🔎 Recuperando entidades relevantes...")
-    results = retrieve(query, TOP_K)
+    if remote:
+        resp = query_server.post_json(
+            host, port, "/retrieve", {"query": query, "top_k": TOP_K}
+        )
+        results, context = resp["results"], resp["context"]
+    else:
+        results = retrieve(query, TOP_K)
+        context = build_context(results, query)
 
     for r in results:
-        print(f"  • {r['label']}  (score={r['score']:.3f})")
-
-    context = build_context(results)
+        via = f"  ← {r['via']['relation']}" if r.get("via") else ""
+        print(f"  • {r['label']}  (score={r['score']:.3f}){via}")
 
     print("\n🧵 Contexto pasado al modelo:")
     print(context)
     print("\n💬 Generando respuesta con el LLM local...\n")
 
-    answer = ask_llm(query, context)
+    if remote:
+        events = query_server.post_json_stream(
+            host, port, "/ask_stream", {"query": query, "context": context}
+        )
+    else:
+        events = ask_llm_stream(query, context)
+
     print("🡆 Respuesta:")
-    print(answer)
+    started = False
+    for event in events:
+        if event.get("done"):
+            print("\n")
+            print(format_metrics(event["metrics"]))
+            break
+        token = event["token"]
+        if not started:
+            token = token.lstrip()   # como el .strip() de la respuesta completa
+            started = bool(token)
+        print(token, end="", flush=True)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Consulta RAG sobre el grafo con el LLM local")
+    ap.add_argument("query", nargs="*", help="Pregunta (si se omite, se pide por teclado)")
+    ap.add_argument("--serve", action="store_true", help="Arranca el servidor y deja los modelos residentes")
+    ap.add_argument("--local", action="store_true", help="No usar el servidor aunque esté disponible")
+    ap.add_argument("--host", default=SERVER_HOST, help="Host del servidor")
+    ap.add_argument("--port", type=int, default=SERVER_PORT, help="Puerto del servidor")
+    args = ap.parse_args()
+
+    if args.serve:
+        run_server(args.host, args.port)
+        return
+
+    if args.query:
+        query = " ".join(args.query)
+    else:
+        query = input("❓ Escribe tu pregunta (Ctrl+C para salir): ").strip()
+
+    if not query:
+        print("No se ingresó ninguna pregunta.")
+        return
+
+    remote = not args.local and query_server.server_available(args.host, args.port)
+    if remote:
+        print(f"🛰️  Usando servidor en http://{args.host}:{args.port}")
+    else:
+        load_resources()
+
+    answer_query(query, remote, args.host, args.port)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# ann.py
+#
+# Motores de búsqueda sobre un vector_index.VectorIndex:
+#
+#   exact  producto punto contra todas las filas + argpartition (O(N), sin
+#          ordenar todo el arreglo como hacía np.argsort).
+#   ivf    índice de listas invertidas: k-means esférico en NumPy agrupa los
+#          vectores en `nlist` celdas; cada consulta solo puntúa las filas de
+#          las `nprobe` celdas más cercanas. Aproximado, pero sublineal.
+#
+# Los parámetros y listas del IVF se guardan dentro del directorio del índice
+# (ivf.json, ivf_centroids.npy, ivf_order.npy, ivf_offsets.npy).
+#
+# Si el índice está particionado por nivel (A, B; ver 02_build_index.py),
+# cada partición tiene su propio motor (ivf_A*, ivf_B*) y TieredSearch
+# busca primero en A y solo baja a B cuando A no alcanza el umbral.
+
+import json
+import os
+
+import numpy as np
+
+BACKENDS = ("exact", "ivf")
+
+
+# ============================
+# 1. Top-k
+# ============================
+
+def topk(scores: np.ndarray, k: int):
+    """Índices y scores de los k mayores, en orden descendente."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    part = np.argpartition(-scores, k - 1)[:k]
+    order = part[np.argsort(-scores[part])]
+    return order, scores[order]
+
+
+def topk_rows(scores: np.ndarray, k: int):
+    """topk() fila por fila sobre una matriz m x N (sin bucles en Python)."""
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        m = len(scores)
+        return np.empty((m, 0), dtype=np.int64), np.empty((m, 0), dtype=np.float32)
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1)
+    return (np.take_along_axis(part, order, axis=1),
+            np.take_along_axis(part_scores, order, axis=1))
+
+
+# ============================
+# 2. Búsqueda exacta
+# ============================
+
+class ExactSearch:
+    name = "exact"
+
+    def __init__(self, index):
+        self.index = index
+
+    def search(self, q_vec: np.ndarray, k: int):
+        return topk(self.index.scores(q_vec), k)
+
+    def search_many(self, Q: np.ndarray, k: int, batch: int = 256):
+        """Varias consultas: un producto matriz-matriz por lote de `batch` consultas."""
+        idxs, scores = [], []
+        for start in range(0, len(Q), batch):
+            i, s = topk_rows(self.index.scores_many(Q[start:start + batch]), k)
+            idxs.append(i)
+            scores.append(s)
+        if not idxs:
+            return topk_rows(np.empty((0, len(self.index)), dtype=np.float32), k)
+        return np.concatenate(idxs), np.concatenate(scores)
+
+
+# ============================
+# 3. IVF (listas invertidas)
+# ============================
+
+def _assign(block: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Celda más cercana (coseno) de cada vector del bloque."""
+    return np.argmax(block @ centroids.T, axis=1).astype(np.int32)
+
+
+def train_ivf(sample: np.ndarray, nlist: int, iters: int = 10, seed: int = 0) -> np.ndarray:
+    """K-means esférico sobre `sample` (float32 normalizado). Devuelve los centroides."""
+    rng = np.random.default_rng(seed)
+    nlist = max(1, min(nlist, len(sample)))
+
+    centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+    for _ in range(iters):
+        labels = _assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        counts = np.bincount(labels, minlength=nlist)
+
+        empty = counts == 0
+        if empty.any():
+            # celdas vacías: se re-siembran con puntos al azar de la muestra
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0.0] = 1.0
+        centroids = sums / norms
+
+    return centroids.astype(np.float32)
+
+
+def build_ivf(index, path: str, nlist: int = 0, iters: int = 10, seed: int = 0,
+              max_train: int = 64, chunk: int = 65536, prefix: str = "ivf"):
+    """
+    Entrena el IVF sobre una muestra de hasta `max_train * nlist` vectores,
+    asigna todas las filas por bloques y lo guarda en el directorio del índice.
+    """
+    n = len(index)
+    if nlist <= 0:
+        nlist = max(1, int(round(np.sqrt(n))))
+
+    rng = np.random.default_rng(seed)
+    sample_idx = np.sort(rng.choice(n, size=min(n, max_train * nlist), replace=False))
+    centroids = train_ivf(index.rows(sample_idx), nlist, iters=iters, seed=seed)
+
+    labels = np.empty(n, dtype=np.int32)
+    for start in range(0, n, chunk):
+        labels[start:start + chunk] = _assign(index.rows(slice(start, start + chunk)), centroids)
+
+    order = np.argsort(labels, kind="stable").astype(np.int32)
+    offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(labels, minlength=len(centroids)), out=offsets[1:])
+
+    np.save(os.path.join(path, f"{prefix}_centroids.npy"), centroids)
+    np.save(os.path.join(path, f"{prefix}_order.npy"), order)
+    np.save(os.path.join(path, f"{prefix}_offsets.npy"), offsets)
+    params = {"nlist": int(len(centroids)), "iters": iters, "seed": seed,
+              "build_id": index.meta.get("build_id")}
+    with open(os.path.join(path, f"{prefix}.json"), "w", encoding="utf-8") as f:
+        json.dump(params, f, indent=2)
+    return params
+
+
+def build_ivf_partitions(index, path: str, nlist: int = 0, iters: int = 10) -> dict:
+    """Un IVF por partición del índice (o uno solo si no está particionado)."""
+    partitions = index.meta.get("partitions")
+    if not partitions:
+        return {"": build_ivf(index, path, nlist=nlist, iters=iters)}
+    return {
+        tier: build_ivf(index.partition(start, stop), path, nlist=nlist, iters=iters,
+                        prefix=f"ivf_{tier}")
+        for tier, (start, stop) in partitions.items()
+        if stop > start
+    }
+
+
+class IVFSearch:
+    name = "ivf"
+
+    def __init__(self, index, path: str, nprobe: int = 8, prefix: str = "ivf"):
+        self.index = index
+        self.nprobe = nprobe
+        with open(os.path.join(path, f"{prefix}.json"), encoding="utf-8") as f:
+            self.params = json.load(f)
+        self.centroids = np.load(os.path.join(path, f"{prefix}_centroids.npy"))
+        self.order = np.load(os.path.join(path, f"{prefix}_order.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, f"{prefix}_offsets.npy"))
+
+    def candidates(self, q_vec: np.ndarray) -> np.ndarray:
+        """Filas de las nprobe celdas más cercanas a la consulta."""
+        cells, _ = topk(self.centroids @ q_vec.astype(np.float32), self.nprobe)
+        return np.concatenate(
+            [self.order[self.offsets[c]:self.offsets[c + 1]] for c in cells]
+        )
+
+    def search(self, q_vec: np.ndarray, k: int):
+        cand = np.sort(self.candidates(q_vec))
+        scores = self.index.rows(cand) @ q_vec.astype(np.float32)
+        order, top = topk(scores, k)
+        return cand[order], top
+
+    def search_many(self, Q: np.ndarray, k: int):
+        # cada consulta visita celdas distintas: se resuelven una a una
+        results = [self.search(q, k) for q in Q]
+        return [r[0] for r in results], [r[1] for r in results]
+
+
+# ============================
+# 4. Búsqueda por niveles
+# ============================
+
+class TieredSearch:
+    """
+    Particiones en orden de prioridad [(nombre, fila inicial, motor), ...].
+    Se busca en la primera; la siguiente solo se consulta si el mejor score
+    acumulado queda por debajo de `threshold`. Devuelve filas globales.
+    """
+    name = "tiered"
+
+    def __init__(self, tiers: list, threshold: float):
+        self.tiers = tiers
+        self.threshold = threshold
+
+    def search(self, q_vec: np.ndarray, k: int):
+        idxs, scores = [], []
+        for _, start, engine in self.tiers:
+            i, s = engine.search(q_vec, k)
+            idxs.append(np.asarray(i) + start)
+            scores.append(np.asarray(s))
+            if len(s) and s[0] >= self.threshold:
+                break
+        if not idxs:
+            return topk(np.empty(0, dtype=np.float32), k)
+        idxs, scores = np.concatenate(idxs), np.concatenate(scores)
+        order, top = topk(scores, k)
+        return idxs[order], top
+
+    def reach(self, idxs, scores) -> int:
+        """
+        Fin (exclusivo) de las filas que search() llegó a consultar para
+        dar estos resultados: el final de A si A alcanzó el umbral, si no
+        el del nivel siguiente, etc. Pasajes y BM25 (03_query.py) no deben
+        mirar más allá.
+        """
+        idxs, scores = np.asarray(idxs), np.asarray(scores)
+        stop = 0
+        for _, start, engine in self.tiers:
+            stop = start + len(engine.index)
+            in_tier = (idxs >= start) & (idxs < stop)
+            if (not (idxs >= stop).any() and in_tier.any()
+                    and scores[in_tier].max() >= self.threshold):
+                break
+        return stop
+
+    def search_many(self, Q: np.ndarray, k: int):
+        """
+        search() para varias consultas: cada nivel se busca con un solo
+        search_many del motor, y solo para las consultas que aún no
+        alcanzan el umbral.
+        """
+        Q = np.asarray(Q)
+        idxs = [[] for _ in range(len(Q))]
+        scores = [[] for _ in range(len(Q))]
+        todo = np.arange(len(Q))
+        for _, start, engine in self.tiers:
+            if not len(todo):
+                break
+            t_idxs, t_scores = engine.search_many(Q[todo], k)
+            weak = []
+            for row, i, s in zip(todo.tolist(), t_idxs, t_scores):
+                idxs[row].append(np.asarray(i) + start)
+                scores[row].append(np.asarray(s))
+                if not (len(s) and s[0] >= self.threshold):
+                    weak.append(row)
+            todo = np.array(weak, dtype=np.int64)
+
+        out_idxs, out_scores = [], []
+        for i, s in zip(idxs, scores):
+            if not i:
+                order, top = topk(np.empty(0, dtype=np.float32), k)
+                out_idxs.append(order)
+                out_scores.append(top)
+                continue
+            i, s = np.concatenate(i), np.concatenate(s)
+            order, top = topk(s, k)
+            out_idxs.append(i[order])
+            out_scores.append(top)
+        return out_idxs, out_scores
+
+
+# ============================
+# 5. Selección del motor
+# ============================
+
+def _load_engine(index, path: str, backend: str, nprobe: int, prefix: str):
+    if backend == "ivf":
+        params_path = os.path.join(path, f"{prefix}.json")
+        if os.path.exists(params_path):
+            with open(params_path, encoding="utf-8") as f:
+                built_for = json.load(f).get("build_id")
+            if built_for == index.meta.get("build_id"):
+                return IVFSearch(index, path, nprobe=nprobe, prefix=prefix)
+        print(f"⚠️  IVF ({prefix}) no disponible o desactualizado; usando búsqueda exacta. "
+              "Ejecuta 02_build_index.py con retrieval.backend: ivf.")
+    return ExactSearch(index)
+
+
+def load_search(index, path: str, backend: str = "exact", nprobe: int = 8,
+                tier_threshold: float = 0.0):
+    """
+    Devuelve el motor configurado. Si se pide IVF pero no está construido
+    (o es de otro build del índice), se avisa y se usa búsqueda exacta.
+    Con índice particionado por nivel devuelve un TieredSearch.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Motor de búsqueda desconocido: {backend} (usa uno de {BACKENDS})")
+
+    partitions = index.meta.get("partitions")
+    if not partitions:
+        return _load_engine(index, path, backend, nprobe, "ivf")
+
+    tiers = []
+    for name in sorted(partitions):          # "A" antes que "B"
+        start, stop = partitions[name]
+        if stop > start:
+            engine = _load_engine(index.partition(start, stop), path, backend, nprobe, f"ivf_{name}")
+            tiers.append((name, start, engine))
+    return TieredSearch(tiers, tier_threshold)
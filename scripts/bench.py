@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# bench.py
+#
+# Benchmark de punta a punta del pipeline sobre grafos sintéticos.
+#
+# Para cada factor de escala (p. ej. 10x, 100x, 1000x) se genera una copia
+# de data/grafo.ttl con Lugares, EventosRituales y Fotos clonados (con sus
+# relaciones entre clones) y se mide:
+#   - extract_entities (en frío, compilando el snapshot, y en caliente)
+#   - construcción del índice (02_build_index.py)
+#   - load_index, carga del índice en 03_query.py y, aparte, carga del LLM
+#   - retrieve(): p50 / p95 / p99 (embeddings de consulta ya en caché)
+#   - empaquetado del contexto: p50 / p95 (cuenta tokens con el LLM)
+#   - LLM: evaluación del prompt, tiempo hasta el primer token y tokens/s
+#
+# Con --llm-queries 0 no se carga el modelo .gguf: solo se miden
+# extracción, índice y retrieve().
+#
+# Los resultados se escriben en JSON para comparar entre versiones.
+#
+# Uso (desde la raíz del repositorio):
+#   python3 scripts/bench.py --scales 10 100 1000 --out bench.json
+#   python3 scripts/bench.py --scales 10 --llm-queries 0     # sin LLM
+
+import argparse
+import copy
+import importlib.util
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import yaml
+from rdflib import RDF, RDFS, Graph, Literal, Namespace, URIRef
+
+SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(SCRIPTS)
+
+FEST = Namespace("http://example.org/festividades#")
+
+# clases que se clonan al escalar el grafo
+SCALED_CLASSES = (
+    FEST.Lugar, FEST.Localidad, FEST.LugarDePaso, FEST.LugarRitual,
+    FEST.EventoRitual, FEST.Foto,
+)
+
+# campos de texto que se alteran en cada copia (el resto, p. ej. el nivel, se copia tal cual)
+VARIED_TEXT = (RDFS.label, RDFS.comment, FEST.descripcionBreve, FEST.descripcionEtnografica)
+
+QUESTIONS = [
+    "¿Quién es el Ukuku?",
+    "¿Qué papel cumplen los Ukukus al amanecer?",
+    "¿Dónde se realiza el Inti Alabado?",
+    "¿Qué naciones peregrinan a Qoyllur Rit'i?",
+    "¿Qué ocurre en el glaciar Colque Punku?",
+    "Fiesta de la Virgen del Carmen en Paucartambo",
+]
+
+
+# ============================
+# 1. Grafo sintético
+# ============================
+
+def scale_graph(ttl: str, out: str, scale: int, seed: int = 0) -> dict:
+    """
+    Escribe en `out` el TTL original más (scale - 1) copias de cada
+    instancia de SCALED_CLASSES. Las relaciones entre instancias clonadas
+    apuntan a la copia del mismo número, así el grafo crece con estructura.
+    """
+    g = Graph()
+    g.parse(ttl, format="turtle")
+    subjects = sorted({s for c in SCALED_CLASSES for s in g.subjects(RDF.type, c)})
+    cloned = set(subjects)
+    rng = random.Random(seed)
+
+    n_triples = len(g)
+    with open(ttl, encoding="utf-8") as f:
+        base = f.read()
+    with open(out, "w", encoding="utf-8") as f:
+        f.write(base)
+        f.write("\n# ---- instancias sintéticas (bench.py) ----\n")
+        for copy_n in range(1, scale):
+            for s in subjects:
+                new_s = URIRef(f"{s}_syn{copy_n}")
+                for p, o in g.predicate_objects(s):
+                    if p in VARIED_TEXT and str(o):
+                        # variación mínima del texto para que no todos los vectores coincidan
+                        o = Literal(f"{o} (copia {copy_n}, {rng.randint(0, 9999)})", lang=o.language)
+                    elif o in cloned:
+                        o = URIRef(f"{o}_syn{copy_n}")
+                    f.write(f"{new_s.n3()} {p.n3()} {o.n3()} .\n")
+                    n_triples += 1
+    return {"instances_cloned": len(subjects) * (scale - 1), "triples": n_triples}
+
+
+def write_config(base_cfg: dict, workdir: str, ttl: str) -> str:
+    """config.yaml de una escala: mismos parámetros, rutas dentro de `workdir`."""
+    cfg = copy.deepcopy(base_cfg)
+    index_dir = os.path.join(workdir, "index")
+    cfg["paths"].update({
+        "ttl": ttl,
+        "entities": os.path.join(index_dir, "entities.jsonl"),
+        "expanded": os.path.join(index_dir, "expanded.jsonl"),
+        "snapshot": os.path.join(index_dir, "grafo.snapshot"),
+        "vectors": os.path.join(index_dir, "vectores"),
+        "index": os.path.join(index_dir, "vectores"),
+    })
+    cfg.setdefault("cache", {})["dir"] = os.path.join(index_dir, "cache")
+    path = os.path.join(workdir, "config.yaml")
+    with open(path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(cfg, f, allow_unicode=True, sort_keys=False)
+    return path
+
+
+# ============================
+# 2. Medición
+# ============================
+
+def _load_script(name: str, alias: str):
+    """Importa un script con nombre numérico (01_..., 03_...) como módulo."""
+    spec = importlib.util.spec_from_file_location(alias, os.path.join(SCRIPTS, name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return out, time.perf_counter() - t0
+
+
+def percentiles(samples: list, ps=(50, 95, 99)) -> dict:
+    if not samples:
+        return {}
+    ms = np.array(samples) * 1000.0
+    out = {f"p{p}_ms": round(float(np.percentile(ms, p)), 3) for p in ps}
+    out["mean_ms"] = round(float(ms.mean()), 3)
+    out["n"] = len(samples)
+    return out
+
+
+def bench_scale(scale: int, base_cfg: dict, workdir: str, n_queries: int, llm_queries: int) -> dict:
+    os.makedirs(workdir, exist_ok=True)
+    result = {"scale": scale}
+
+    ttl = os.path.join(workdir, "grafo.ttl")
+    result["graph"] = scale_graph(os.path.join(ROOT, base_cfg["paths"]["ttl"]), ttl, scale)
+    cfg_path = write_config(base_cfg, workdir, ttl)
+
+    # --- 01: extracción (en frío compila el snapshot; en caliente lo reutiliza)
+    os.environ["KG_LLM_CONFIG"] = cfg_path
+    extract = _load_script("01_extract_entities.py", f"extract_x{scale}")
+    _, cold = _timed(extract.extract_entities)
+    _, warm = _timed(extract.extract_entities)
+    result["extract_entities_s"] = {"cold": round(cold, 3), "warm": round(warm, 3)}
+
+    # --- 02: construcción del índice (proceso aparte: el script corre al importarse)
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, os.path.join(SCRIPTS, "02_build_index.py")],
+        cwd=workdir, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"02_build_index.py falló (x{scale}):\n{proc.stderr}")
+    result["build_index_s"] = round(time.perf_counter() - t0, 3)
+
+    # --- 03: carga y consultas
+    cwd = os.getcwd()
+    os.chdir(workdir)   # 03_query.py lee config.yaml del directorio actual
+    try:
+        query = _load_script("03_query.py", f"query_x{scale}")
+        _, t_index = _timed(query.vector_index.load_index, query.INDEX_FILE)
+        _, t_load = _timed(query.load_retrieval)
+        result["load_index_s"] = round(t_index, 4)
+        result["load_retrieval_s"] = round(t_load, 3)
+        result["entities"] = len(query.IDS)
+        if llm_queries > 0:
+            _, t_llm = _timed(query.load_llm)
+            result["load_llm_s"] = round(t_llm, 3)
+
+        rng = random.Random(0)
+        labels = [e["label"] for e in query.uri_to_entity.values()]
+        queries = [rng.choice(QUESTIONS + labels) for _ in range(n_queries)]
+        query.encode_queries(sorted(set(queries)))   # solo se mide la búsqueda
+
+        retrieve_t, pack_t, results = [], [], None
+        for q in queries:
+            results, t = _timed(query.retrieve, q)
+            retrieve_t.append(t)
+            if llm_queries > 0:     # el empaquetado tokeniza con el LLM
+                _, t = _timed(query.build_context, results, q)
+                pack_t.append(t)
+        result["retrieve"] = percentiles(retrieve_t)
+        if pack_t:
+            result["context_pack"] = percentiles(pack_t, ps=(50, 95))
+
+        prompt_eval, ttft, tps = [], [], []
+        for q in QUESTIONS[:llm_queries]:
+            context = query.build_context(query.retrieve(q), q)
+            for event in query.ask_llm_stream(f"{q} (bench x{scale})", context):
+                m = event.get("metrics", {}) if event.get("done") else {}
+                if m.get("ttft_s") is not None:      # una respuesta de la caché no trae tiempos
+                    prompt_eval.append(m.get("prompt_eval_s", 0.0))
+                    ttft.append(m["ttft_s"])
+                    tps.append(m.get("tokens_per_s", 0.0))
+        if ttft:
+            result["llm"] = {
+                "prompt_eval_s_median": round(float(np.median(prompt_eval)), 3),
+                "ttft_s_median": round(float(np.median(ttft)), 3),
+                "tokens_per_s_median": round(float(np.median(tps)), 2),
+                "n": len(ttft),
+            }
+    finally:
+        os.chdir(cwd)
+    return result
+
+
+# ============================
+# 3. Entrada principal
+# ============================
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de kg-llm sobre grafos escalados.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[10, 100, 1000],
+                        help="factores de escala del grafo (1 = grafo original)")
+    parser.add_argument("--queries", type=int, default=200, help="consultas de retrieve() por escala")
+    parser.add_argument("--llm-queries", type=int, default=3,
+                        help="preguntas al LLM por escala (0 = no medir el LLM)")
+    parser.add_argument("--config", default=os.path.join(ROOT, "config.yaml"))
+    parser.add_argument("--workdir", default=None, help="directorio de trabajo (por defecto, uno temporal)")
+    parser.add_argument("--out", default="bench.json", help="archivo JSON de resultados")
+    args = parser.parse_args()
+
+    with open(args.config, encoding="utf-8") as f:
+        base_cfg = yaml.safe_load(f)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="kg-llm-bench-")
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "config": {k: base_cfg.get(k) for k in ("index", "retrieval", "model")},
+        "runs": [],
+    }
+    for scale in args.scales:
+        print(f"\n=== Escala x{scale} ===")
+        run = bench_scale(scale, base_cfg, os.path.join(workdir, f"x{scale}"),
+                          args.queries, args.llm_queries)
+        report["runs"].append(run)
+        print(json.dumps(run, indent=2, ensure_ascii=False))
+        # se escribe tras cada escala: una ejecución larga interrumpida no pierde lo medido
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    print(f"\nResultados en {args.out}  (datos en {workdir})")
+
+
+if __name__ == "__main__":
+    main()
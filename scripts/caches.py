@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# caches.py
+#
+# Caché LRU en memoria con copia en disco (pickle), para que sobreviva a
+# reinicios del proceso. Lleva contadores de aciertos y fallos.
+#
+# `stamp` identifica los datos de los que dependen las entradas (p. ej. el
+# build del índice): si el stamp guardado en disco no coincide, la caché
+# se descarta al cargar.
+#
+# Uso:
+#   cache = LRUCache(max_items=5000, path="index/cache/consultas.pkl")
+#   vec = cache.get(key)
+#   if vec is None:
+#       vec = calcular(...)
+#       cache.put(key, vec)
+#   cache.save()
+
+import hashlib
+import json
+import os
+import pickle
+import re
+import unicodedata
+from collections import OrderedDict
+
+
+def normalize_query(text: str) -> str:
+    """Forma canónica de una pregunta para usarla como clave de caché."""
+    text = unicodedata.normalize("NFC", text).casefold()
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def stable_hash(obj) -> str:
+    """Hash corto y estable de cualquier valor serializable a JSON."""
+    data = json.dumps(obj, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha1(data).hexdigest()
+
+
+class LRUCache:
+
+    def __init__(self, max_items: int, path: str | None = None, stamp: str | None = None):
+        self.max_items = max_items
+        self.path = path
+        self.stamp = stamp
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._dirty = False
+        if path:
+            self.load()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_items:
+            self._data.popitem(last=False)   # el menos usado recientemente
+        self._dirty = True
+
+    def clear(self):
+        self._data.clear()
+        self._dirty = True
+
+    def set_stamp(self, stamp: str | None):
+        """Cambia el stamp; si es distinto del actual, vacía la caché."""
+        if stamp != self.stamp:
+            self.stamp = stamp
+            self.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "items": len(self._data),
+            "max_items": self.max_items,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    # ---------- persistencia ----------
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "rb") as f:
+                saved = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return  # caché corrupta: se empieza vacía
+        if not isinstance(saved, dict) or saved.get("stamp") != self.stamp:
+            self._dirty = True  # datos de otro build: se invalida
+            return
+        self._data = OrderedDict(saved["items"][-self.max_items:])
+
+    def save(self):
+        """Escribe la caché en disco (de forma atómica) si cambió."""
+        if not self.path or not self._dirty:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(
+                {"stamp": self.stamp, "items": list(self._data.items())},
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(tmp, self.path)
+        self._dirty = False
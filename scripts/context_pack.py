@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# context_pack.py
+#
+# Empaquetado del contexto del prompt por presupuesto de tokens.
+#
+# Cada entidad recuperada aporta una línea "- etiqueta: texto". En lugar de
+# un número fijo de líneas, se llenan exactamente
+#     n_ctx - max_tokens - tokens del resto del prompt
+# en orden de score; la primera línea que no cabe se recorta.
+#
+# Para no tokenizar en la consulta, 02_build_index.py cuenta los tokens de
+# la línea de cada fila del índice con el tokenizador del .gguf y los guarda:
+#   ctx_tokens.npy    (N,) int32   tokens de la línea (incluido el salto)
+#   ctx_tokens.json   modelo con el que se contaron
+#
+# Si faltan o son de otro modelo, 03_query.py cuenta al vuelo con el LLM.
+
+import json
+import os
+
+import numpy as np
+
+# por debajo de esto no merece la pena recortar una línea más
+MIN_TOKENS = 16
+
+
+def context_line(label: str, text: str) -> str:
+    return f"- {label}: {text}"
+
+
+def model_stamp(model_path: str) -> dict:
+    """Identifica el tokenizador: nombre y fecha del .gguf."""
+    return {
+        "model": os.path.basename(model_path),
+        "mtime": os.path.getmtime(model_path) if os.path.exists(model_path) else None,
+    }
+
+
+# ============================
+# 1. Construcción (build)
+# ============================
+
+def count_tokens(model_path: str, lines: list) -> np.ndarray:
+    """Tokens de cada línea (+1 por el salto de línea), solo con el vocabulario del modelo."""
+    from llama_cpp import Llama
+    tok = Llama(model_path=model_path, vocab_only=True, verbose=False)
+    return np.array(
+        [len(tok.tokenize(line.encode("utf-8"), add_bos=False)) + 1 for line in lines],
+        dtype=np.int32,
+    )
+
+
+def save_token_counts(path: str, counts: np.ndarray, model_path: str):
+    np.save(os.path.join(path, "ctx_tokens.npy"), counts)
+    with open(os.path.join(path, "ctx_tokens.json"), "w", encoding="utf-8") as f:
+        json.dump(model_stamp(model_path), f, indent=2)
+
+
+def load_token_counts(path: str, model_path: str):
+    """Array alineado con las filas del índice, o None si falta o es de otro modelo."""
+    stamp_path = os.path.join(path, "ctx_tokens.json")
+    if not os.path.exists(stamp_path):
+        return None
+    with open(stamp_path, encoding="utf-8") as f:
+        if json.load(f) != model_stamp(model_path):
+            return None
+    return np.load(os.path.join(path, "ctx_tokens.npy"))
+
+
+# ============================
+# 2. Empaquetado (consulta)
+# ============================
+
+def trim(line: str, n_tokens: int, budget: int) -> str:
+    """
+    Recorta `line` para que quepa en `budget` tokens sin volver a tokenizar:
+    se estima por la proporción caracteres/token de la propia línea (con
+    margen) y se corta en el último fin de frase o, si no hay, de palabra.
+    """
+    keep = int(len(line) * (budget - 2) / n_tokens * 0.9)
+    if keep <= 0:
+        return ""
+    cut = line[:keep]
+    end = cut.rfind(". ")
+    if end > keep // 2:
+        return cut[:end + 1]
+    return cut.rsplit(" ", 1)[0] + " …"
+
+
+def pack(lines: list, counts: list, budget: int) -> str:
+    """
+    Une las líneas (ya en orden de score) hasta agotar `budget` tokens.
+    counts[i] son los tokens de lines[i] incluido su salto de línea.
+    """
+    out = []
+    for line, n in zip(lines, counts):
+        if n <= budget:
+            out.append(line)
+            budget -= n
+            continue
+        if budget >= MIN_TOKENS:
+            short = trim(line, n, budget)
+            if short:
+                out.append(short)
+        break
+    return "\n".join(out)
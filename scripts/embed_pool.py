@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# embed_pool.py
+#
+# Codificación de textos para 02_build_index.py, pensada para
+# reconstrucciones completas de grafos grandes:
+#
+#   - los textos se ordenan por longitud (en palabras, aproximación barata a
+#     tokens) y se agrupan en lotes de `batch_size`: en cada lote los textos
+#     miden parecido y casi no se gasta cómputo en padding;
+#   - con `workers` > 1 los lotes se reparten entre procesos, cada uno con su
+#     copia del modelo, fijado (sched_setaffinity) a un subconjunto de núcleos
+#     y con torch limitado a esos núcleos;
+#   - los vectores se escriben a un .npy en disco (np.memmap) a medida que
+#     llegan los lotes, en el orden original de los textos.
+#
+# Con pocos textos (una actualización incremental) no compensa cargar el
+# modelo en cada proceso: se codifica en el propio proceso.
+
+import multiprocessing as mp
+import os
+import queue
+import time
+
+import numpy as np
+
+_worker_model = None
+
+
+def available_cores() -> list:
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:      # sin sched_getaffinity (no Linux)
+        return list(range(os.cpu_count() or 1))
+
+
+def length_batches(texts: list, batch_size: int) -> list:
+    """Lotes de índices de `texts`, de más largo a más corto (los lentos primero)."""
+    order = sorted(range(len(texts)), key=lambda i: -len(texts[i].split()))
+    return [order[a:a + batch_size] for a in range(0, len(order), batch_size)]
+
+
+# ============================
+# 1. Procesos de codificación
+# ============================
+
+def _init_worker(model_name: str, core_sets):
+    global _worker_model
+    # cada proceso toma un grupo de la cola; uno que reemplace a otro caído
+    # ya no encuentra ninguno y usa todos los núcleos en vez de bloquearse
+    try:
+        cores = core_sets.get(timeout=1)
+    except queue.Empty:
+        cores = available_cores()
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    import torch
+    torch.set_num_threads(len(cores))
+    from sentence_transformers import SentenceTransformer
+    _worker_model = SentenceTransformer(model_name)
+
+
+def _encode_batch(job):
+    idx, texts, batch_size = job
+    return idx, _worker_model.encode(texts, batch_size=batch_size, convert_to_numpy=True)
+
+
+def _core_sets(workers: int) -> list:
+    """Reparte los núcleos disponibles en `workers` grupos contiguos."""
+    return [[int(c) for c in group] for group in np.array_split(available_cores(), workers)]
+
+
+# ============================
+# 2. Entrada
+# ============================
+
+def encode(texts: list, model_name: str, out_path: str, load_model,
+           workers: int = 0, batch_size: int = 32) -> np.ndarray:
+    """
+    Vectores (float32, en el orden de `texts`) en un .npy mapeado en
+    `out_path`. `load_model` devuelve el modelo del proceso actual (solo se
+    llama si no se usan procesos). workers=0 usa todos los núcleos.
+    """
+    n_cores = len(available_cores())
+    workers = min(workers or n_cores, n_cores)
+    batches = length_batches(texts, batch_size)
+    if len(batches) < 2 * workers:
+        workers = 1
+
+    out = None
+    t0 = time.perf_counter()
+    done = 0
+
+    def store(idx, vecs):
+        nonlocal out, done
+        if out is None:
+            out = np.lib.format.open_memmap(
+                out_path, mode="w+", dtype=np.float32, shape=(len(texts), vecs.shape[1]))
+        out[idx] = vecs
+        done += len(idx)
+        elapsed = time.perf_counter() - t0
+        print(f"\r  Codificadas {done}/{len(texts)}  ({done / elapsed:.1f} textos/s)", end="", flush=True)
+
+    jobs = [(idx, [texts[i] for i in idx], batch_size) for idx in batches]
+    if workers == 1:
+        model = load_model()
+        for idx, batch, _ in jobs:
+            store(idx, model.encode(batch, batch_size=batch_size, convert_to_numpy=True))
+    else:
+        # fork: el script que llama (02_build_index.py) corre al importarse,
+        # con spawn se volvería a ejecutar en cada proceso
+        ctx = mp.get_context("fork")
+        core_sets = ctx.Queue()
+        for cores in _core_sets(workers):
+            core_sets.put(cores)
+        with ctx.Pool(workers, initializer=_init_worker, initargs=(model_name, core_sets)) as pool:
+            for idx, vecs in pool.imap_unordered(_encode_batch, jobs):
+                store(idx, vecs)
+    print()    # cierra la línea de progreso (\r)
+    print(f"  [{workers} proceso(s), lotes de {batch_size}]")
+
+    out.flush()
+    return out
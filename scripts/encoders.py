@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# encoders.py
+#
+# Codificadores de consultas intercambiables (embeddings.backend en config.yaml):
+#
+#   sentence_transformers   el de siempre; importa PyTorch (lento y pesado en la Pi)
+#   onnx                    all-MiniLM-L6-v2 exportado a ONNX + tokenizador de
+#                           `tokenizers`: sin PyTorch, opcionalmente con pesos int8
+#
+# Los dos producen el mismo vector que usa 02_build_index.py (mean pooling
+# sobre la máscara de atención + normalización L2), así que el índice no
+# cambia. La exportación se hace una vez, en una máquina con PyTorch:
+#
+#   python3 scripts/encoders.py --export modelos/minilm-onnx [--int8]
+#   python3 scripts/encoders.py --check  modelos/minilm-onnx [--int8]
+#
+# El directorio resultante (model.onnx, model_int8.onnx, tokenizer.json)
+# se copia a la Pi y se apunta con embeddings.onnx_dir.
+
+import argparse
+import os
+
+import numpy as np
+
+EMB_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+MAX_SEQ_LENGTH = 256   # el mismo límite que usa sentence-transformers para este modelo
+
+BACKENDS = ("sentence_transformers", "onnx")
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-9)
+
+
+class SentenceTransformerEncoder:
+
+    def __init__(self, model_name: str = EMB_MODEL, threads: int = 0):
+        from sentence_transformers import SentenceTransformer
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        self.name = model_name
+        self.model = SentenceTransformer(model_name)
+
+    def encode(self, texts: list) -> np.ndarray:
+        return _normalize(self.model.encode(texts, convert_to_numpy=True).astype(np.float32))
+
+
+class OnnxEncoder:
+
+    def __init__(self, model_dir: str, int8: bool = False, threads: int = 0):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_file = "model_int8.onnx" if int8 else "model.onnx"
+        self.name = encoder_id({"backend": "onnx", "int8": int8})
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file), options, providers=["CPUExecutionProvider"]
+        )
+        self.inputs = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, texts: list) -> np.ndarray:
+        batch = self.tokenizer.encode_batch(list(texts))
+        ids = np.array([e.ids for e in batch], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in batch], dtype=np.int64)
+        feed = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self.inputs:
+            feed["token_type_ids"] = np.zeros_like(ids)
+
+        hidden = self.session.run(None, feed)[0]          # (B, T, dim)
+        m = mask[..., None].astype(np.float32)
+        pooled = (hidden * m).sum(axis=1) / np.clip(m.sum(axis=1), 1e-9, None)
+        return _normalize(pooled.astype(np.float32))
+
+
+def encoder_id(cfg: dict) -> str:
+    """Identifica el codificador configurado sin cargarlo (clave de la caché de consultas)."""
+    if cfg.get("backend", "sentence_transformers") == "onnx":
+        return f"{EMB_MODEL}:onnx{'-int8' if cfg.get('int8', False) else ''}"
+    return EMB_MODEL
+
+
+def load_encoder(cfg: dict):
+    """Codificador según la sección `embeddings` de config.yaml."""
+    backend = cfg.get("backend", "sentence_transformers")
+    if backend == "sentence_transformers":
+        return SentenceTransformerEncoder(EMB_MODEL, threads=cfg.get("threads", 0))
+    if backend == "onnx":
+        return OnnxEncoder(cfg["onnx_dir"], int8=cfg.get("int8", False), threads=cfg.get("threads", 0))
+    raise ValueError(f"Codificador desconocido: {backend} (usa uno de {BACKENDS})")
+
+
+# ============================
+# Exportación y verificación (requieren PyTorch)
+# ============================
+
+def export_onnx(out_dir: str, int8: bool = False, model_name: str = EMB_MODEL):
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    tokenizer.save_pretrained(out_dir)          # escribe tokenizer.json
+    model = AutoModel.from_pretrained(model_name).eval()
+
+    sample = tokenizer(["Qoyllur Rit'i"], return_tensors="pt")
+    names = ["input_ids", "attention_mask", "token_type_ids"]
+    path = os.path.join(out_dir, "model.onnx")
+    torch.onnx.export(
+        model,
+        tuple(sample[n] for n in names),
+        path,
+        input_names=names,
+        output_names=["last_hidden_state"],
+        dynamic_axes={n: {0: "batch", 1: "seq"} for n in names + ["last_hidden_state"]},
+        opset_version=14,
+    )
+    print("Exportado:", path)
+
+    if int8:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        qpath = os.path.join(out_dir, "model_int8.onnx")
+        quantize_dynamic(path, qpath, weight_type=QuantType.QInt8)
+        print("Cuantizado:", qpath)
+
+
+def check(model_dir: str, int8: bool = False):
+    """Compara el codificador ONNX con sentence-transformers (coseno por frase)."""
+    texts = [
+        "¿Quién es el Ukuku?",
+        "Sinakara es una quebrada y territorio ritual temporalmente habitado.",
+        "Foto: Descenso con cruz desde Colque Punku (17 junio 2025)",
+        "Fiesta de la Virgen del Carmen en Paucartambo",
+    ]
+    reference = SentenceTransformerEncoder().encode(texts)
+    onnx = OnnxEncoder(model_dir, int8=int8).encode(texts)
+    cos = (reference * onnx).sum(axis=1)
+    for t, c in zip(texts, cos):
+        print(f"  {c:.5f}  {t}")
+    print(f"Coseno mínimo: {cos.min():.5f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta o verifica el codificador ONNX.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--export", metavar="DIR", help="exportar all-MiniLM-L6-v2 a ONNX en DIR")
+    group.add_argument("--check", metavar="DIR", help="comparar el ONNX de DIR con sentence-transformers")
+    parser.add_argument("--int8", action="store_true", help="también pesos int8 (quantize_dynamic)")
+    args = parser.parse_args()
+
+    if args.export:
+        export_onnx(args.export, int8=args.int8)
+    else:
+        check(args.check, int8=args.int8)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# entity_store.py
+#
+# Lectura y escritura de los archivos de entidades de 01_extract_entities.py.
+#
+#   entities.jsonl / expanded.jsonl   una entidad por línea, JSON compacto
+#   entities.jsonl.idx.json           URIs en orden de línea + tamaño/mtime del .jsonl
+#   entities.jsonl.offsets.npy        (N+1,) int64  byte de inicio de cada línea
+#   entities.json / expanded.json     lista JSON (formato anterior, se sigue leyendo)
+#
+# El formato se decide por la extensión de paths.entities / paths.expanded.
+# Con el .jsonl, 03_query.py no parsea el archivo al arrancar: solo carga
+# las URIs y los offsets, y lee del disco las pocas entidades que aparecen
+# en los resultados (EntityStore).
+
+import json
+import os
+from array import array
+from collections.abc import Mapping
+
+import numpy as np
+
+
+def jsonl_path(path: str) -> str:
+    """La ruta .jsonl que corresponde a una ruta de entidades configurada."""
+    return os.path.splitext(path)[0] + ".jsonl"
+
+
+def _index_paths(path: str):
+    return path + ".idx.json", path + ".offsets.npy"
+
+
+def _stamp(path: str) -> list:
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+# ============================
+# 1. Escritura
+# ============================
+
+class JsonlWriter:
+    """
+    Escribe una entidad por línea en un temporal y, al cerrar sin error, lo
+    renombra y guarda el índice de offsets. URIs y offsets también van a
+    disco a medida que llegan: la memoria no crece con el nº de entidades.
+    """
+
+    FLUSH = 65536   # offsets que se juntan antes de escribirlos
+
+    def __init__(self, path: str):
+        self.path = path
+        self.tmp = path + ".tmp"
+        idx_path, off_path = _index_paths(path)
+        self.uris_tmp, self.offsets_tmp = idx_path + ".tmp", off_path + ".tmp"
+        self.count = 0
+        self.end = 0
+
+    def __enter__(self):
+        self.f = open(self.tmp, "wb")
+        self.uris_f = open(self.uris_tmp, "w", encoding="utf-8")
+        self.offsets_f = open(self.offsets_tmp, "wb")
+        self.offsets = array("q", [0])
+        return self
+
+    def write(self, entity: dict):
+        line = json.dumps(entity, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+        self.f.write(line)
+        self.uris_f.write(json.dumps(entity["uri"], ensure_ascii=False) + "\n")
+        self.end += len(line)
+        self.count += 1
+        self.offsets.append(self.end)
+        if len(self.offsets) >= self.FLUSH:
+            self.offsets.tofile(self.offsets_f)
+            del self.offsets[:]
+
+    def __exit__(self, exc_type, exc, tb):
+        self.offsets.tofile(self.offsets_f)
+        for f in (self.f, self.uris_f, self.offsets_f):
+            f.close()
+        try:
+            if exc_type is None:
+                os.replace(self.tmp, self.path)
+                self._save_index()
+        finally:
+            for tmp in (self.tmp, self.uris_tmp, self.offsets_tmp):
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        return False
+
+    def _save_index(self):
+        """Pasa los temporales al formato de _save_offsets() sin cargarlos en memoria."""
+        idx_path, off_path = _index_paths(self.path)
+        raw = np.memmap(self.offsets_tmp, dtype=np.int64, mode="r")
+        out = np.lib.format.open_memmap(off_path, mode="w+", dtype=np.int64, shape=(self.count + 1,))
+        out[:] = raw
+        out.flush()
+        del out, raw
+
+        with open(self.uris_tmp, encoding="utf-8") as src, open(idx_path, "w", encoding="utf-8") as f:
+            f.write('{"stamp": ' + json.dumps(_stamp(self.path)) + ', "uris": [')
+            for i, line in enumerate(src):
+                f.write((", " if i else "") + line.rstrip("\n"))
+            f.write("]}")
+
+
+def _save_offsets(path: str, uris: list, offsets: list):
+    idx_path, off_path = _index_paths(path)
+    np.save(off_path, np.asarray(offsets, dtype=np.int64))
+    with open(idx_path, "w", encoding="utf-8") as f:
+        json.dump({"stamp": _stamp(path), "uris": uris}, f, ensure_ascii=False)
+
+
+def write_entities(path: str, entities) -> int:
+    """Guarda las entidades en el formato que indica la extensión. Devuelve cuántas."""
+    if path.endswith(".jsonl"):
+        with JsonlWriter(path) as w:
+            for e in entities:
+                w.write(e)
+        return w.count
+    entities = list(entities)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(entities, f, indent=2, ensure_ascii=False)
+    return len(entities)
+
+
+# ============================
+# 2. Lectura
+# ============================
+
+def iter_entities(path: str):
+    """Entidades una a una (en un .json se carga la lista completa)."""
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(f)
+
+
+def load_entities(path: str) -> list:
+    return list(iter_entities(path))
+
+
+class EntityStore(Mapping):
+    """
+    URI -> entidad sobre un .jsonl, leída del disco al pedirla. En memoria
+    solo quedan las URIs y los offsets; cada acceso es un pread de una línea.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        idx_path, off_path = _index_paths(path)
+        idx = None
+        if os.path.exists(idx_path) and os.path.exists(off_path):
+            with open(idx_path, encoding="utf-8") as f:
+                idx = json.load(f)
+        if idx is None or idx.get("stamp") != _stamp(path):
+            # .jsonl escrito o editado sin índice: se recorre una vez
+            idx = {"uris": _reindex(path)}
+        self.uris = idx["uris"]
+        self.offsets = np.load(off_path)
+        self.row = {u: i for i, u in enumerate(self.uris)}
+        self.fd = os.open(path, os.O_RDONLY)
+
+    def __del__(self):
+        fd = getattr(self, "fd", None)
+        if fd is not None:
+            os.close(fd)
+
+    def __len__(self) -> int:
+        return len(self.uris)
+
+    def __iter__(self):
+        return iter(self.uris)
+
+    def __contains__(self, uri) -> bool:
+        return uri in self.row
+
+    def __getitem__(self, uri: str) -> dict:
+        return self.record(self.row[uri])
+
+    def record(self, i: int, fields=None) -> dict:
+        """Entidad de la línea i; con `fields`, solo esas claves."""
+        a, b = int(self.offsets[i]), int(self.offsets[i + 1])
+        e = json.loads(os.pread(self.fd, b - a, a))
+        if fields is not None:
+            e = {k: e[k] for k in fields if k in e}
+        return e
+
+
+def _reindex(path: str) -> list:
+    uris, offsets = [], [0]
+    with open(path, "rb") as f:
+        for line in f:
+            offsets.append(offsets[-1] + len(line))
+            if line.strip():
+                uris.append(json.loads(line)["uri"])
+            else:
+                offsets.pop()          # línea vacía: se salta sin registro
+                offsets[-1] += len(line)
+    _save_offsets(path, uris, offsets)
+    return uris
+
+
+def open_entities(path: str) -> Mapping:
+    """URI -> entidad: EntityStore perezoso para .jsonl, dict en memoria para .json."""
+    if path.endswith(".jsonl"):
+        return EntityStore(path)
+    return {e["uri"]: e for e in iter_entities(path)}
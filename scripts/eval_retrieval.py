@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# eval_retrieval.py
+#
+# Calidad vs. velocidad de la recuperación para distintas variantes del
+# índice (exacto / IVF, float32 / float16 / int8, denso / híbrido, ...).
+#
+# Entrada: un JSONL de preguntas con las URIs que deberían recuperarse
+#   {"question": "¿Quién es el Ukuku?", "expected": ["Ukuku", "QConcepto_Ukuku"]}
+# (nombres locales sin "#" se completan con el namespace de la ontología).
+#
+# Cada variante de eval.variants (config.yaml) se monta detrás del mismo
+# retrieve() de 03_query.py y se reporta, lado a lado:
+#   recall@k    fracción de URIs esperadas entre los k primeros (media)
+#   MRR         1 / posición del primer acierto (media)
+#   QPS         consultas por segundo de retrieve() (embeddings ya en caché)
+#   memoria     MB de los arreglos que la variante mapea (vectores, IVF, BM25, ...)
+#
+# Los vectores de cada dtype se derivan del índice construido por
+# 02_build_index.py: para comparar contra float32 "de verdad", constrúyelo
+# con index.dtype: float32.
+#
+# Uso (desde la raíz del repositorio):
+#   python3 scripts/eval_retrieval.py
+#   python3 scripts/eval_retrieval.py --questions data/eval/otras.jsonl --out eval.json
+
+import argparse
+import importlib.util
+import json
+import os
+import time
+
+SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+
+NAMESPACE = "http://example.org/festividades#"
+
+# variantes por defecto si config.yaml no define eval.variants
+DEFAULT_VARIANTS = [
+    {"name": "exacto-f32", "dtype": "float32", "backend": "exact"},
+    {"name": "exacto-f16", "dtype": "float16", "backend": "exact"},
+    {"name": "exacto-int8", "dtype": "int8", "backend": "exact"},
+    {"name": "ivf-f16", "dtype": "float16", "backend": "ivf", "nprobe": 8},
+    {"name": "hibrido-f16", "dtype": "float16", "backend": "exact", "hybrid": True},
+]
+
+
+def load_questions(path: str) -> list:
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            expected = [u if "://" in u else NAMESPACE + u for u in item["expected"]]
+            questions.append({"question": item["question"], "expected": set(expected)})
+    return questions
+
+
+def _dir_mb(path: str, prefixes: tuple) -> float:
+    """Tamaño en MB de los archivos de `path` que empiezan por alguno de `prefixes`."""
+    if not os.path.isdir(path):
+        return 0.0
+    total = sum(
+        os.path.getsize(os.path.join(path, name))
+        for name in os.listdir(path)
+        if name.startswith(prefixes) and os.path.isfile(os.path.join(path, name))
+    )
+    return total / 2**20
+
+
+# ============================
+# 1. Variantes
+# ============================
+
+class Variants:
+    """Construye (una vez por dtype) y monta cada variante sobre el módulo de 03_query.py."""
+
+    def __init__(self, query, workdir: str, ivf_cfg: dict):
+        self.q = query
+        self.workdir = workdir
+        self.ivf_cfg = ivf_cfg
+        self.base = query.VEC
+        self.base_vectors = None
+        self.built = {}            # dtype -> directorio
+        self.ivf_built = set()
+        # componentes opcionales del índice base (alineados con sus filas)
+        self.bm25 = query.BM25 or query.lexical.load_bm25(query.INDEX_DIR)
+        self.adj = query.ADJ or query.graph_expand.load_adjacency(query.INDEX_DIR)
+        self.passages = query.PASSAGES or query.passages.load_passages(
+            query.INDEX_DIR, self.base.meta.get("build_id"))
+
+    def index_dir(self, dtype: str) -> str:
+        if dtype not in self.built:
+            if self.base_vectors is None:
+                self.base_vectors = self.base.rows(slice(None))
+            path = os.path.join(self.workdir, dtype)
+            self.q.vector_index.save_index(
+                path, self.base_vectors, self.base.ids, self.base.hashes or [],
+                dtype=dtype, partitions=self.base.meta.get("partitions"),
+            )
+            self.built[dtype] = path
+        return self.built[dtype]
+
+    def mount(self, v: dict) -> float:
+        """Deja la variante activa en 03_query.py y devuelve su memoria en MB."""
+        q = self.q
+        path = self.index_dir(v.get("dtype", "float32"))
+        vec = q.vector_index.load_index(path)
+        backend = v.get("backend", "exact")
+        if backend == "ivf" and path not in self.ivf_built:
+            q.ann.build_ivf_partitions(
+                vec, path, nlist=v.get("nlist", self.ivf_cfg.get("nlist", 0)),
+                iters=self.ivf_cfg.get("iters", 10),
+            )
+            self.ivf_built.add(path)
+
+        q.VEC = vec
+        q.SEARCH = q.ann.load_search(
+            vec, path, backend=backend, nprobe=v.get("nprobe", 8),
+            tier_threshold=v.get("tier_threshold", q.RETRIEVAL.get("tier_threshold", 0.0)),
+        )
+        q.BM25 = self.bm25 if v.get("hybrid") else None
+        q.ADJ = self.adj if v.get("expand") else None
+        if q.ADJ is not None and q.EDGE_WEIGHTS is None:
+            q.EDGE_WEIGHTS = q.ADJ.type_weights(
+                q.EXPAND.get("weights", {}), q.EXPAND.get("default_weight", 0.7))
+        q.PASSAGES = self.passages if v.get("passages") else None
+
+        mb = _dir_mb(path, ("vectors", "scales") + (("ivf",) if backend == "ivf" else ()))
+        if q.BM25 is not None:
+            mb += _dir_mb(q.INDEX_DIR, ("bm25",))
+        if q.ADJ is not None:
+            mb += _dir_mb(q.INDEX_DIR, ("graph",))
+        if q.PASSAGES is not None:
+            mb += _dir_mb(os.path.join(q.INDEX_DIR, "passages"), ("vectors", "scales", "owner", "indptr"))
+        return mb
+
+
+# ============================
+# 2. Métricas
+# ============================
+
+def evaluate(query, questions: list, ks: list) -> dict:
+    max_k = max(ks)
+    recalls = {k: 0.0 for k in ks}
+    mrr = 0.0
+
+    t0 = time.perf_counter()
+    ranked = [[r["uri"] for r in query.retrieve(item["question"], max_k)] for item in questions]
+    elapsed = time.perf_counter() - t0
+
+    for item, uris in zip(questions, ranked):
+        expected = item["expected"]
+        for k in ks:
+            recalls[k] += len(expected & set(uris[:k])) / len(expected)
+        rank = next((i for i, u in enumerate(uris, 1) if u in expected), None)
+        if rank is not None:
+            mrr += 1.0 / rank
+
+    n = len(questions)
+    out = {f"recall@{k}": round(recalls[k] / n, 4) for k in ks}
+    out["mrr"] = round(mrr / n, 4)
+    out["qps"] = round(n / elapsed, 1) if elapsed > 0 else float("inf")
+    return out
+
+
+# ============================
+# 3. Entrada principal
+# ============================
+
+def _load_query_module():
+    spec = importlib.util.spec_from_file_location("query", os.path.join(SCRIPTS, "03_query.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def main():
+    query = _load_query_module()      # lee config.yaml del directorio actual
+    eval_cfg = query.CFG.get("eval", {})
+
+    parser = argparse.ArgumentParser(description="Recall@k, MRR, QPS y memoria por variante del índice.")
+    parser.add_argument("--questions", default=eval_cfg.get("questions", "data/eval/preguntas_qoylluriti.jsonl"))
+    parser.add_argument("--k", type=int, nargs="+", default=eval_cfg.get("k", [1, 5, 10]))
+    parser.add_argument("--repeat", type=int, default=eval_cfg.get("repeat", 5),
+                        help="pasadas por variante (el QPS se mide con todas)")
+    parser.add_argument("--out", default=None, help="guardar resultados en JSON")
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions)
+    query.load_retrieval()
+    query.encode_queries([item["question"] for item in questions])   # QPS sin el encoder
+
+    variants = Variants(
+        query,
+        workdir=eval_cfg.get("workdir", os.path.join(os.path.dirname(query.INDEX_FILE), "eval")),
+        ivf_cfg=query.CFG.get("index", {}).get("ivf", {}),
+    )
+
+    rows = []
+    for v in eval_cfg.get("variants", DEFAULT_VARIANTS):
+        mb = variants.mount(v)
+        metrics = evaluate(query, questions * args.repeat, args.k)
+        rows.append({"variant": v.get("name", str(v)), **metrics, "memory_mb": round(mb, 3), "config": v})
+
+    header = ["variante"] + [f"R@{k}" for k in args.k] + ["MRR", "QPS", "MB"]
+    print(f"\n{len(questions)} preguntas de {args.questions}\n")
+    print("  ".join(f"{h:>14}" for h in header))
+    for r in rows:
+        cells = [r["variant"]] + [r[f"recall@{k}"] for k in args.k] + [r["mrr"], r["qps"], r["memory_mb"]]
+        print("  ".join(f"{c:>14}" for c in cells))
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"questions": args.questions, "n": len(questions), "results": rows},
+                      f, indent=2, ensure_ascii=False)
+        print(f"\nResultados en {args.out}")
+
+
+if __name__ == "__main__":
+    main()
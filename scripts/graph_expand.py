@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# graph_expand.py
+#
+# Expansión por vecindario del grafo en la recuperación.
+#
+# 02_build_index.py convierte las `relations` de expanded.json en una
+# matriz de adyacencia CSR sobre las filas del índice (solo entidades
+# indexadas), con un tipo de arista por predicado. Cada relación s -p-> o
+# se guarda en los dos sentidos: o -^p-> s es la arista inversa.
+#
+#   graph_indptr.npy   (N+1,) int64   vecinos de la fila i: indptr[i]:indptr[i+1]
+#   graph_indices.npy  (E,)   int32   fila del vecino
+#   graph_etype.npy    (E,)   int16   tipo de arista
+#   graph_etypes.json  nombres de los tipos ("documentaA", "^documentaA", ...)
+#
+# En la consulta, los top-k de la búsqueda vectorial se expanden 1–2 saltos
+# y cada vecino se puntúa combinando su similitud con la consulta, el score
+# del nodo desde el que se llegó y el peso del tipo de arista.
+
+import json
+import os
+
+import numpy as np
+
+
+def local_name(uri: str) -> str:
+    if "#" in uri:
+        return uri.split("#")[-1]
+    return uri.rsplit("/", 1)[-1]
+
+
+# ============================
+# 1. Construcción (build)
+# ============================
+
+def build_adjacency(ids: list, entities: list):
+    """Devuelve (indptr, indices, etype, nombres de tipo) para las filas `ids`."""
+    row_of = {uri: i for i, uri in enumerate(ids)}
+    etype_of = {}
+    edges = []   # (fila origen, fila destino, tipo)
+
+    def etype(name):
+        t = etype_of.get(name)
+        if t is None:
+            t = etype_of[name] = len(etype_of)
+        return t
+
+    for e in entities:
+        src = row_of.get(e["uri"])
+        if src is None:
+            continue
+        for rel in e.get("relations", []):
+            dst = row_of.get(rel["object"])
+            if dst is None or dst == src:
+                continue
+            name = local_name(rel["property"])
+            edges.append((src, dst, etype(name)))
+            edges.append((dst, src, etype("^" + name)))
+
+    edges = np.array(sorted(set(edges)), dtype=np.int64).reshape(-1, 3)
+    indptr = np.zeros(len(ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(edges[:, 0], minlength=len(ids)), out=indptr[1:])
+    names = [None] * len(etype_of)
+    for name, t in etype_of.items():
+        names[t] = name
+    return indptr, edges[:, 1].astype(np.int32), edges[:, 2].astype(np.int16), names
+
+
+def save_adjacency(path: str, indptr, indices, etype, names):
+    np.save(os.path.join(path, "graph_indptr.npy"), indptr)
+    np.save(os.path.join(path, "graph_indices.npy"), indices)
+    np.save(os.path.join(path, "graph_etype.npy"), etype)
+    with open(os.path.join(path, "graph_etypes.json"), "w", encoding="utf-8") as f:
+        json.dump(names, f, ensure_ascii=False)
+
+
+# ============================
+# 2. Carga y expansión (consulta)
+# ============================
+
+class Adjacency:
+
+    def __init__(self, path: str):
+        self.indptr = np.load(os.path.join(path, "graph_indptr.npy"), mmap_mode="r")
+        self.indices = np.load(os.path.join(path, "graph_indices.npy"), mmap_mode="r")
+        self.etype = np.load(os.path.join(path, "graph_etype.npy"), mmap_mode="r")
+        with open(os.path.join(path, "graph_etypes.json"), encoding="utf-8") as f:
+            self.names = json.load(f)
+
+    def neighbors(self, i: int):
+        a, b = self.indptr[i], self.indptr[i + 1]
+        return self.indices[a:b], self.etype[a:b]
+
+    def type_weights(self, weights: dict, default: float) -> np.ndarray:
+        """Peso por tipo de arista; la inversa usa el peso del predicado directo."""
+        return np.array(
+            [weights.get(n.lstrip("^"), default) for n in self.names], dtype=np.float32
+        )
+
+
+def load_adjacency(path: str):
+    """None si el índice no tiene grafo (índices anteriores o .npz)."""
+    if not os.path.exists(os.path.join(path, "graph_indptr.npy")):
+        return None
+    return Adjacency(path)
+
+
+def expand(adj: Adjacency, index, q_vec: np.ndarray, seeds, seed_scores, top_k: int,
+           hops: int = 1, alpha: float = 0.5, weights: np.ndarray | None = None):
+    """
+    Expande los nodos semilla `hops` saltos y devuelve los top_k de la unión
+    semillas + vecinos como (filas, scores, origen). Para un vecino n al que
+    se llega desde p por una arista de tipo t:
+
+        score(n) = w[t] * (alpha * cos(q, n) + (1 - alpha) * score(p))
+
+    y se queda el mejor camino. `origen` es None para las semillas y
+    (fila de p, nombre del tipo de arista) para los vecinos.
+    """
+    if weights is None:
+        weights = np.ones(len(adj.names), dtype=np.float32)
+
+    best = {int(i): float(s) for i, s in zip(seeds, seed_scores)}
+    via = {i: None for i in best}
+    frontier = list(best)
+
+    for _ in range(hops):
+        cand = {}
+        for p in frontier:
+            nbrs, types = adj.neighbors(p)
+            w = weights[types]
+            keep = w > 0
+            for n, t, wt in zip(nbrs[keep], types[keep], w[keep]):
+                n = int(n)
+                if n in via and via[n] is None:
+                    continue   # ya es semilla
+                cand.setdefault(n, []).append((p, int(t), float(wt)))
+        if not cand:
+            break
+
+        rows = np.fromiter(cand, dtype=np.int64)
+        sims = index.rows(rows) @ q_vec.astype(np.float32)
+        improved = set()
+        for n, sim in zip(rows.tolist(), sims.tolist()):
+            for p, t, wt in cand[n]:
+                score = wt * (alpha * sim + (1.0 - alpha) * best[p])
+                if score > best.get(n, float("-inf")):
+                    best[n] = score
+                    via[n] = (p, adj.names[t])
+                    improved.add(n)
+        frontier = sorted(improved)
+
+    ranked = sorted(best.items(), key=lambda kv: -kv[1])[:top_k]
+    return [i for i, _ in ranked], [s for _, s in ranked], [via[i] for i, _ in ranked]
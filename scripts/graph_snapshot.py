@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# graph_snapshot.py
+#
+# Copia binaria compilada del grafo TTL, para no re-parsear Turtle en cada
+# script. Guarda los términos internados (URIs, literales, blank nodes) y los
+# triples como un arreglo plano de enteros. Se reconstruye solo cuando cambia
+# el hash del TTL de origen.
+#
+# Uso:
+#   from graph_snapshot import load_graph
+#   g = load_graph("data/grafo.ttl")
+#   for s, p, o in g: ...
+#   for s, _, o in g.triples((None, RDF.type, None)): ...
+
+import hashlib
+import os
+import pickle
+from array import array
+
+from rdflib import BNode, Literal, URIRef
+
+SNAPSHOT_VERSION = 1
+
+# tipos de término en la tabla internada
+_URI, _BNODE, _LITERAL = 0, 1, 2
+
+
+# ============================
+# 1. Utilidades
+# ============================
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def default_snapshot_path(ttl_path: str) -> str:
+    """data/grafo.ttl -> data/grafo.snapshot"""
+    return os.path.splitext(ttl_path)[0] + ".snapshot"
+
+
+def _encode_term(t):
+    if isinstance(t, URIRef):
+        return (_URI, str(t))
+    if isinstance(t, BNode):
+        return (_BNODE, str(t))
+    return (_LITERAL, str(t), t.language, str(t.datatype) if t.datatype else None)
+
+
+def _decode_term(rec):
+    kind = rec[0]
+    if kind == _URI:
+        return URIRef(rec[1])
+    if kind == _BNODE:
+        return BNode(rec[1])
+    _, value, lang, dt = rec
+    return Literal(value, lang=lang, datatype=URIRef(dt) if dt else None)
+
+
+# ============================
+# 2. Grafo compilado
+# ============================
+
+class SnapshotGraph:
+    """
+    Vista de solo lectura sobre el snapshot, con la parte de la API de
+    rdflib.Graph que usan los scripts: iteración, triples((s, p, o)) y len().
+    Los términos rdflib se crean bajo demanda.
+    """
+
+    def __init__(self, terms: list, triples: array):
+        self._terms = terms
+        self._ids = triples          # s0, p0, o0, s1, p1, o1, ...
+        self._nodes = [None] * len(terms)
+        self._term_to_id = None
+
+    def __len__(self):
+        return len(self._ids) // 3
+
+    def _node(self, i: int):
+        n = self._nodes[i]
+        if n is None:
+            n = self._nodes[i] = _decode_term(self._terms[i])
+        return n
+
+    def _id(self, term):
+        if self._term_to_id is None:
+            self._term_to_id = {rec: i for i, rec in enumerate(self._terms)}
+        return self._term_to_id.get(_encode_term(term))
+
+    def __iter__(self):
+        ids, node = self._ids, self._node
+        for k in range(0, len(ids), 3):
+            yield node(ids[k]), node(ids[k + 1]), node(ids[k + 2])
+
+    def triples(self, pattern):
+        """Igual que Graph.triples: None en una posición = comodín."""
+        bound = []
+        for pos, term in enumerate(pattern):
+            if term is None:
+                continue
+            i = self._id(term)
+            if i is None:
+                return              # el término no aparece en el grafo
+            bound.append((pos, i))
+
+        ids, node = self._ids, self._node
+        for k in range(0, len(ids), 3):
+            if all(ids[k + pos] == i for pos, i in bound):
+                yield node(ids[k]), node(ids[k + 1]), node(ids[k + 2])
+
+
+# ============================
+# 3. Compilar / cargar
+# ============================
+
+def compile_graph(ttl_path: str):
+    """Parsea el TTL con rdflib y devuelve (términos, triples) internados."""
+    from rdflib import Graph
+
+    g = Graph()
+    g.parse(ttl_path, format="turtle")
+
+    term_ids = {}
+    terms = []
+    triples = array("i")
+    for triple in g:
+        for t in triple:
+            rec = _encode_term(t)
+            i = term_ids.get(rec)
+            if i is None:
+                i = term_ids[rec] = len(terms)
+                terms.append(rec)
+            triples.append(i)
+    return terms, triples
+
+
+def load_graph(ttl_path: str, snapshot_path: str | None = None) -> SnapshotGraph:
+    """
+    Devuelve el grafo desde el snapshot si está al día con el TTL;
+    si no existe o el TTL cambió, lo recompila y lo guarda.
+    """
+    snapshot_path = snapshot_path or default_snapshot_path(ttl_path)
+    ttl_hash = file_sha256(ttl_path)
+
+    if os.path.exists(snapshot_path):
+        try:
+            with open(snapshot_path, "rb") as f:
+                snap = pickle.load(f)
+            if snap.get("version") == SNAPSHOT_VERSION and snap.get("ttl_sha256") == ttl_hash:
+                triples = array("i")
+                triples.frombytes(snap["triples"])
+                return SnapshotGraph(snap["terms"], triples)
+        except (OSError, pickle.UnpicklingError, EOFError, KeyError, AttributeError):
+            pass  # snapshot corrupto o de otra versión: se recompila
+
+    terms, triples = compile_graph(ttl_path)
+
+    os.makedirs(os.path.dirname(os.path.abspath(snapshot_path)), exist_ok=True)
+    tmp = snapshot_path + ".tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(
+            {
+                "version": SNAPSHOT_VERSION,
+                "ttl_sha256": ttl_hash,
+                "terms": terms,
+                "triples": triples.tobytes(),
+            },
+            f,
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+    os.replace(tmp, snapshot_path)   # escritura atómica
+
+    return SnapshotGraph(terms, triples)
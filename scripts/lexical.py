@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# lexical.py
+#
+# Índice invertido BM25 sobre el campo `text` de las entidades, para que los
+# nombres propios y términos quechuas ("Ukuku", "Qolla", "Colque Punku",
+# "Sinakara") que MiniLM representa mal se encuentren por coincidencia exacta.
+#
+# Se guarda en el directorio del índice, alineado con sus filas:
+#   bm25.json          parámetros (k1, b), nº de documentos, longitud media
+#   bm25_vocab.json    término -> id
+#   bm25_indptr.npy    (V+1,) int64   postings del término t: indptr[t]:indptr[t+1]
+#   bm25_docs.npy      (P,)   int32   fila del documento
+#   bm25_tf.npy        (P,)   uint16  frecuencia del término en el documento
+#   bm25_doclen.npy    (N,)   int32   nº de tokens por documento
+#
+# fuse() combina estos scores con los de la búsqueda vectorial.
+
+import json
+import os
+import re
+import unicodedata
+from collections import Counter
+
+import numpy as np
+
+from ann import topk
+
+# palabras vacías frecuentes en las descripciones (no aportan al ranking)
+STOPWORDS = {
+    "de", "la", "el", "en", "y", "a", "los", "las", "del", "se", "que", "con",
+    "por", "un", "una", "su", "sus", "al", "es", "lo", "como", "para", "o",
+    "e", "le", "les", "mas", "muy", "sin", "sobre", "entre", "donde", "cual",
+    "quien", "esta", "este", "son",
+}
+
+_APOSTROPHES = re.compile(r"[’'`´]")
+_NON_WORD = re.compile(r"[^a-z0-9ñ]+")
+
+
+def tokenize(text: str) -> list:
+    """
+    Minúsculas, sin tildes (conservando la ñ) y sin apóstrofos, para que
+    "Rit’i", "Rit'i" y "riti" coincidan.
+    """
+    text = _APOSTROPHES.sub("", text.casefold()).replace("ñ", "\0")
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c)).replace("\0", "ñ")
+    return [t for t in _NON_WORD.split(text) if len(t) > 1 and t not in STOPWORDS]
+
+
+# ============================
+# 1. Construcción (build)
+# ============================
+
+def build_bm25(path: str, texts: list, k1: float = 1.2, b: float = 0.75):
+    """Construye y guarda el índice BM25 de `texts` (uno por fila del índice)."""
+    vocab = {}
+    postings = []       # por término: lista de (doc, tf)
+    doclen = np.zeros(len(texts), dtype=np.int32)
+
+    for doc, text in enumerate(texts):
+        tokens = tokenize(text)
+        doclen[doc] = len(tokens)
+        for term, tf in Counter(tokens).items():
+            t = vocab.get(term)
+            if t is None:
+                t = vocab[term] = len(postings)
+                postings.append([])
+            postings[t].append((doc, min(tf, 65535)))
+
+    indptr = np.zeros(len(postings) + 1, dtype=np.int64)
+    np.cumsum([len(p) for p in postings], out=indptr[1:])
+    flat = [x for p in postings for x in p]
+    docs = np.array([d for d, _ in flat], dtype=np.int32)
+    tfs = np.array([tf for _, tf in flat], dtype=np.uint16)
+
+    np.save(os.path.join(path, "bm25_indptr.npy"), indptr)
+    np.save(os.path.join(path, "bm25_docs.npy"), docs)
+    np.save(os.path.join(path, "bm25_tf.npy"), tfs)
+    np.save(os.path.join(path, "bm25_doclen.npy"), doclen)
+    with open(os.path.join(path, "bm25_vocab.json"), "w", encoding="utf-8") as f:
+        json.dump(vocab, f, ensure_ascii=False)
+    params = {
+        "k1": k1,
+        "b": b,
+        "n_docs": len(texts),
+        "avgdl": float(doclen.mean()) if len(texts) else 0.0,
+    }
+    with open(os.path.join(path, "bm25.json"), "w", encoding="utf-8") as f:
+        json.dump(params, f, indent=2)
+    return {"terms": len(vocab), "postings": int(len(docs))}
+
+
+# ============================
+# 2. Consulta
+# ============================
+
+class BM25:
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "bm25.json"), encoding="utf-8") as f:
+            p = json.load(f)
+        with open(os.path.join(path, "bm25_vocab.json"), encoding="utf-8") as f:
+            self.vocab = json.load(f)
+        self.k1, self.b = p["k1"], p["b"]
+        self.n_docs, self.avgdl = p["n_docs"], p["avgdl"] or 1.0
+        self.indptr = np.load(os.path.join(path, "bm25_indptr.npy"), mmap_mode="r")
+        self.docs = np.load(os.path.join(path, "bm25_docs.npy"), mmap_mode="r")
+        self.tf = np.load(os.path.join(path, "bm25_tf.npy"), mmap_mode="r")
+        # factor de normalización por longitud, precalculado una vez
+        doclen = np.load(os.path.join(path, "bm25_doclen.npy"))
+        self._norm = (self.k1 * (1.0 - self.b + self.b * doclen / self.avgdl)).astype(np.float32)
+
+    def scores(self, query: str) -> np.ndarray:
+        """Score BM25 de cada fila (0 donde no aparece ningún término)."""
+        out = np.zeros(self.n_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            t = self.vocab.get(term)
+            if t is None:
+                continue
+            a, b = self.indptr[t], self.indptr[t + 1]
+            docs = self.docs[a:b]
+            tf = self.tf[a:b].astype(np.float32)
+            df = b - a
+            idf = np.log(1.0 + (self.n_docs - df + 0.5) / (df + 0.5))
+            out[docs] += idf * tf * (self.k1 + 1.0) / (tf + self._norm[docs])
+        return out
+
+
+def load_bm25(path: str):
+    """None si el índice no tiene BM25 (índices anteriores o .npz)."""
+    if not os.path.exists(os.path.join(path, "bm25.json")):
+        return None
+    return BM25(path)
+
+
+def fuse(index, q_vec, dense_idxs, dense_scores, lex_scores, pool: int, weight: float):
+    """
+    Fusiona candidatos densos y léxicos. Cada candidato recibe
+        score = (1 - weight) * coseno + weight * bm25 / max(bm25)
+    Devuelve (filas, scores) ordenados de mayor a menor.
+    """
+    lex_top, lex_top_scores = topk(lex_scores, pool)
+    lex_top = lex_top[lex_top_scores > 0]
+
+    dense = {int(i): float(s) for i, s in zip(dense_idxs, dense_scores)}
+    missing = [int(i) for i in lex_top if int(i) not in dense]
+    if missing:
+        sims = index.rows(np.array(missing)) @ q_vec.astype(np.float32)
+        dense.update(zip(missing, sims.tolist()))
+
+    cand = np.fromiter(dense, dtype=np.int64)
+    lex = lex_scores[cand]
+    lex_max = float(lex.max()) if len(lex) else 0.0
+    lex_norm = lex / lex_max if lex_max > 0 else lex
+    fused = (1.0 - weight) * np.array([dense[i] for i in cand.tolist()]) + weight * lex_norm
+
+    order = np.argsort(-fused)
+    return cand[order], fused[order]
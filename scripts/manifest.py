@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# manifest.py
+#
+# Builds versionados del índice y cambio atómico del build activo.
+#
+# Cada ejecución de 02_build_index.py escribe en un directorio nuevo,
+#   <paths.vectors>.builds/<fecha>-<build_id>/
+# con todo lo del índice (vectores, IVF, BM25, grafo, pasajes, tokens) más
+# un manifest.json que describe cómo se hizo:
+#   version      nombre del directorio del build
+#   encoder      modelo de embeddings y dimensión de los vectores
+#   text_recipe  qué campos de la entidad se embebieron (y los pasajes)
+#   graph        ruta y sha1 del TTL del que salieron las entidades
+#   entities     archivo de entidades, nº de filas y hash de sus URIs
+# Al terminar, <paths.vectors> (un enlace simbólico) se cambia al build nuevo
+# con os.replace: quien abra el índice ve el build anterior completo o el
+# nuevo completo, nunca una mezcla. Los builds viejos se borran dejando
+# los `keep` más recientes (un proceso que aún los tenga mapeados los sigue
+# leyendo: en Linux el archivo vive hasta que se cierra).
+#
+# 03_query.py valida el manifest antes de cambiar de build en caliente.
+
+import hashlib
+import json
+import os
+import shutil
+import time
+
+MANIFEST = "manifest.json"
+MANIFEST_FORMAT = 1
+
+
+def builds_dir(path: str) -> str:
+    return path.rstrip("/") + ".builds"
+
+
+def new_build_dir(path: str, build_id: str) -> str:
+    """Directorio (aún vacío) para un build nuevo del índice publicado en `path`."""
+    version = f"{time.strftime('%Y%m%d-%H%M%S')}-{build_id[:8]}"
+    out, n = os.path.join(builds_dir(path), version), 1
+    while os.path.exists(out):          # dos builds en el mismo segundo
+        n += 1
+        out = os.path.join(builds_dir(path), f"{version}.{n}")
+    os.makedirs(out)
+    return out
+
+
+def current(path: str) -> str:
+    """Directorio real del build activo (resuelve el enlace una sola vez)."""
+    return os.path.realpath(path)
+
+
+def file_sha1(path: str, chunk: int = 2**20) -> str | None:
+    if not os.path.exists(path):
+        return None
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+# ============================
+# 1. Escritura y publicación (02_build_index.py)
+# ============================
+
+def write_manifest(build_dir: str, **fields) -> dict:
+    manifest = {
+        "format": MANIFEST_FORMAT,
+        "version": os.path.basename(build_dir),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        **fields,
+    }
+    tmp = os.path.join(build_dir, MANIFEST + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, os.path.join(build_dir, MANIFEST))
+    return manifest
+
+
+def adopt_legacy(path: str):
+    """
+    Un índice anterior a los builds versionados (un directorio normal en
+    `path`) pasa a ser un build más y `path` queda como enlace. Solo ocurre
+    una vez; no es atómico.
+    """
+    if os.path.isdir(path) and not os.path.islink(path):
+        legacy = os.path.join(builds_dir(path), "legacy")
+        os.makedirs(builds_dir(path), exist_ok=True)
+        os.rename(path, legacy)
+        os.symlink(os.path.relpath(legacy, os.path.dirname(os.path.abspath(path))), path)
+
+
+def publish(path: str, build_dir: str, keep: int = 3):
+    """Apunta `path` al build nuevo (atómico) y borra los builds más viejos."""
+    parent = os.path.dirname(os.path.abspath(path))
+    tmp = path.rstrip("/") + ".tmp-link"
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+    os.symlink(os.path.relpath(build_dir, parent), tmp)
+    os.replace(tmp, path)
+
+    root = builds_dir(path)
+    active = os.path.realpath(build_dir)
+    old = sorted(
+        (d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d))),
+        key=lambda d: os.path.getmtime(os.path.join(root, d)),
+    )
+    for d in old[:max(0, len(old) - keep)]:
+        if os.path.realpath(os.path.join(root, d)) != active:
+            shutil.rmtree(os.path.join(root, d), ignore_errors=True)
+
+
+# ============================
+# 2. Lectura y validación (03_query.py)
+# ============================
+
+def load_manifest(build_dir: str) -> dict | None:
+    path = os.path.join(build_dir, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def validate(manifest: dict | None, meta: dict, ids: list, entities, encoder_model: str,
+             encoder_dim: int | None = None) -> list:
+    """
+    Problemas que impiden usar un build (lista vacía = válido). `entities`
+    es el mapeo URI -> entidad que se servirá junto al índice.
+    """
+    if manifest is None:
+        return [f"falta {MANIFEST} (índice de antes de los builds versionados)"]
+
+    problems = []
+    if manifest.get("format") != MANIFEST_FORMAT:
+        problems.append(f"formato de manifest desconocido: {manifest.get('format')}")
+    enc = manifest.get("encoder", {})
+    if enc.get("model") != encoder_model:
+        problems.append(f"modelo de embeddings {enc.get('model')} ≠ {encoder_model} (consultas)")
+    if enc.get("dim") != meta.get("dim"):
+        problems.append(f"dimensión del manifest {enc.get('dim')} ≠ vectores {meta.get('dim')}")
+    if encoder_dim is not None and encoder_dim != meta.get("dim"):
+        problems.append(f"el codificador de consultas da {encoder_dim} dimensiones, el índice {meta.get('dim')}")
+
+    count = manifest.get("entities", {}).get("count")
+    if count != meta.get("count") or count != len(ids):
+        problems.append(f"nº de filas: manifest {count}, meta {meta.get('count')}, ids {len(ids)}")
+    missing = sum(1 for uri in ids if uri not in entities)
+    if missing:
+        problems.append(f"{missing} URIs del índice no están en el archivo de entidades")
+    return problems
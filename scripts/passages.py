@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# passages.py
+#
+# Índice de pasajes: las descripciones largas se dividen en trozos de
+# hasta `max_words` palabras (por frases) y cada trozo tiene su propio
+# vector. Un solo vector de MiniLM no representa bien varios párrafos de
+# descripcionEtnografica; con pasajes, la entidad puntúa con su mejor trozo
+# (max-sim) y al prompt solo van los trozos que coinciden con la pregunta.
+#
+# Se guarda en <índice>/passages/, en el mismo formato que vector_index
+# (meta.json, vectors.npy, ...) más:
+#   passages.json      max_words y build_id del índice de entidades
+#   owner.npy          (P,)   int32   fila de la entidad de cada pasaje
+#   indptr.npy         (N+1,) int64   pasajes de la fila i: indptr[i]:indptr[i+1]
+#   texts.json         texto de cada pasaje
+#   ctx_tokens.npy     (P,)   int32   tokens de la línea de contexto (opcional)
+
+import json
+import os
+import re
+
+import numpy as np
+
+import ann
+import vector_index
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def split_passages(text: str, max_words: int) -> list:
+    """
+    Trozos de hasta max_words palabras, sin cortar frases salvo que una
+    sola frase sea más larga. Textos cortos devuelven [] (basta el vector
+    de la entidad).
+    """
+    if len(text.split()) <= max_words:
+        return []
+
+    chunks, current = [], []
+    for sentence in _SENTENCE_END.split(text.strip()):
+        words = sentence.split()
+        if current and len(current) + len(words) > max_words:
+            chunks.append(" ".join(current))
+            current = []
+        while len(words) > max_words:
+            chunks.append(" ".join(words[:max_words]))
+            words = words[max_words:]
+        current.extend(words)
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+# ============================
+# 1. Construcción (build)
+# ============================
+
+def save_passages(path: str, vectors, ids: list, hashes: list, owner, n_entities: int,
+                  texts: list, entity_build_id: str, max_words: int, dtype: str = "float32"):
+    """Guarda el índice de pasajes en <path>/passages (owner debe ir en orden creciente)."""
+    out = os.path.join(path, "passages")
+    vector_index.save_index(out, vectors, ids, hashes, dtype=dtype)
+
+    owner = np.asarray(owner, dtype=np.int32)
+    indptr = np.zeros(n_entities + 1, dtype=np.int64)
+    np.cumsum(np.bincount(owner, minlength=n_entities), out=indptr[1:])
+    np.save(os.path.join(out, "owner.npy"), owner)
+    np.save(os.path.join(out, "indptr.npy"), indptr)
+    with open(os.path.join(out, "texts.json"), "w", encoding="utf-8") as f:
+        json.dump(texts, f, ensure_ascii=False)
+    with open(os.path.join(out, "passages.json"), "w", encoding="utf-8") as f:
+        json.dump({"max_words": max_words, "entity_build_id": entity_build_id}, f, indent=2)
+
+
+def load_previous(path: str, dtype: str) -> dict:
+    """{hash: vector} de los pasajes del build anterior (para no re-embeberlos)."""
+    out = os.path.join(path, "passages")
+    if not os.path.exists(os.path.join(out, "meta.json")):
+        return {}
+    prev = vector_index.load_index(out)
+    if prev.hashes is None or prev.meta.get("dtype") != dtype:
+        return {}
+    return dict(zip(prev.hashes, prev.rows(slice(None))))
+
+
+# ============================
+# 2. Consulta
+# ============================
+
+class PassageIndex:
+
+    def __init__(self, path: str):
+        out = os.path.join(path, "passages")
+        self.index = vector_index.load_index(out)
+        self.owner = np.load(os.path.join(out, "owner.npy"), mmap_mode="r")
+        self.indptr = np.load(os.path.join(out, "indptr.npy"), mmap_mode="r")
+        with open(os.path.join(out, "texts.json"), encoding="utf-8") as f:
+            self.texts = json.load(f)
+        tokens_path = os.path.join(out, "ctx_tokens.npy")
+        self.tokens = np.load(tokens_path) if os.path.exists(tokens_path) else None
+
+    def max_sim(self, q_vec: np.ndarray, idxs, scores, k: int, limit: int | None = None):
+        """
+        Une los resultados por entidad con los k mejores pasajes: cada
+        entidad queda con el máximo entre su score y el de sus pasajes.
+        Con `limit` solo cuentan los pasajes de las filas < limit.
+        """
+        out_idxs, out_scores = self.max_sim_many(q_vec[None, :], [idxs], [scores], k, [limit])
+        return out_idxs[0], out_scores[0]
+
+    def max_sim_many(self, Q: np.ndarray, idxs_list, scores_list, k: int, limits=None):
+        """max_sim() para varias consultas con un solo producto matriz-matriz."""
+        sims = self.index.scores_many(Q)
+        for j, limit in enumerate(limits or []):
+            if limit is not None:
+                # los pasajes están ordenados por entidad: los de filas >= limit van al final
+                sims[j, int(self.indptr[limit]):] = -np.inf
+        p_idx, p_scores = ann.topk_rows(sims, k)
+
+        out_idxs, out_scores = [], []
+        for idxs, scores, pi, ps in zip(idxs_list, scores_list, p_idx, p_scores):
+            best = {int(i): float(s) for i, s in zip(idxs, scores)}
+            for row, s in zip(self.owner[pi].tolist(), ps.tolist()):
+                if s > best.get(row, float("-inf")):
+                    best[row] = s
+            ranked = sorted(best.items(), key=lambda kv: -kv[1])
+            out_idxs.append(np.array([i for i, _ in ranked], dtype=np.int64))
+            out_scores.append(np.array([s for _, s in ranked], dtype=np.float32))
+        return out_idxs, out_scores
+
+    def select(self, row: int, q_vec: np.ndarray, n: int):
+        """Los n pasajes de la entidad más parecidos a la consulta, en orden de texto (o None)."""
+        a, b = int(self.indptr[row]), int(self.indptr[row + 1])
+        if a == b:
+            return None
+        sims = self.index.rows(slice(a, b)) @ q_vec.astype(np.float32)
+        top, _ = ann.topk(sims, n)
+        return sorted(int(a + i) for i in top)
+
+    def text(self, pids: list) -> str:
+        return " … ".join(self.texts[p] for p in pids)
+
+
+def load_passages(path: str, entity_build_id: str):
+    """None si no hay índice de pasajes o es de otro build del índice de entidades."""
+    params_path = os.path.join(path, "passages", "passages.json")
+    if not os.path.exists(params_path):
+        return None
+    with open(params_path, encoding="utf-8") as f:
+        if json.load(f).get("entity_build_id") != entity_build_id:
+            print("⚠️  Índice de pasajes desactualizado; se ignora. Ejecuta 02_build_index.py.")
+            return None
+    return PassageIndex(path)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# query_server.py
+#
+# Servidor HTTP local que mantiene residentes el índice y los modelos
+# cargados por 03_query.py, y cliente mínimo para hablar con él.
+#
+# El servidor no sabe nada de embeddings ni de LLM: recibe un diccionario
+# {ruta: función} y expone cada función como endpoint JSON (POST).
+# Si la función devuelve un generador en lugar de un dict, la respuesta se
+# envía en streaming como NDJSON (un objeto JSON por línea).
+#
+# Uso (lo normal es lanzarlo desde 03_query.py):
+#   python3 scripts/03_query.py --serve
+
+import json
+import socket
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
+
+
+# ============================
+# 1. Servidor
+# ============================
+
+def make_handler(endpoints: dict):
+    """
+    Crea la clase de handler HTTP para un conjunto de endpoints.
+    Cada endpoint es una función que recibe el JSON del cuerpo (dict)
+    y devuelve un dict serializable o un generador de dicts (streaming).
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def _send_json(self, status: int, payload: dict):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_stream(self, events):
+            # HTTP/1.0 sin Content-Length: el fin de la respuesta es el cierre.
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+            self.end_headers()
+            try:
+                for event in events:
+                    line = json.dumps(event, ensure_ascii=False) + "\n"
+                    self.wfile.write(line.encode("utf-8"))
+                    self.wfile.flush()
+            except Exception as e:  # error a mitad de stream: se informa en la última línea
+                line = json.dumps({"error": f"{type(e).__name__}: {e}"}, ensure_ascii=False)
+                self.wfile.write((line + "\n").encode("utf-8"))
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send_json(200, {"ok": True, "endpoints": sorted(endpoints)})
+            else:
+                self._send_json(404, {"error": f"Ruta desconocida: {self.path}"})
+
+        def do_POST(self):
+            fn = endpoints.get(self.path)
+            if fn is None:
+                self._send_json(404, {"error": f"Ruta desconocida: {self.path}"})
+                return
+
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+            except (ValueError, json.JSONDecodeError) as e:
+                self._send_json(400, {"error": f"JSON inválido: {e}"})
+                return
+
+            try:
+                result = fn(payload)
+                if isinstance(result, dict):
+                    self._send_json(200, result)
+                else:
+                    self._send_stream(result)
+            except KeyError as e:
+                self._send_json(400, {"error": f"Falta el campo {e}"})
+            except ValueError as e:
+                self._send_json(400, {"error": str(e)})
+            except Exception as e:  # el servidor no debe caerse por una consulta
+                # excepciones con `status` (p. ej. scheduler.Busy -> 503) eligen su código
+                self._send_json(getattr(e, "status", 500), {"error": f"{type(e).__name__}: {e}"})
+
+        def log_message(self, fmt, *args):
+            # Una línea corta por petición en lugar del formato de Apache.
+            print(f"  [{self.address_string()}] {fmt % args}")
+
+    return Handler
+
+
+def serve(endpoints: dict, host: str, port: int, threaded: bool = False):
+    """
+    Arranca el servidor y atiende peticiones hasta Ctrl+C. Con threaded=True
+    cada petición va en su hilo (los endpoints deben admitir concurrencia).
+    """
+    server_cls = ThreadingHTTPServer if threaded else HTTPServer
+    httpd = server_cls((host, port), make_handler(endpoints))
+    httpd.daemon_threads = True
+    print(f"🛰️  Servidor escuchando en http://{host}:{port}")
+    print(f"   Endpoints: {', '.join(sorted(endpoints))}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\nDeteniendo servidor...")
+    finally:
+        httpd.server_close()
+
+
+# ============================
+# 2. Cliente
+# ============================
+
+def server_available(host: str, port: int, timeout: float = 0.2) -> bool:
+    """Comprueba (rápido) si hay algo escuchando en host:port."""
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def post_json(host: str, port: int, path: str, payload: dict, timeout: float = 300.0) -> dict:
+    """Envía un POST JSON al servidor y devuelve la respuesta decodificada."""
+    req = urllib.request.Request(
+        f"http://{host}:{port}{path}",
+        data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+        headers={"Content-Type": "application/json; charset=utf-8"},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        detail = json.loads(e.read() or b"{}").get("error", e.reason)
+        raise RuntimeError(f"El servidor respondió {e.code}: {detail}") from None
+
+
+def post_json_stream(host: str, port: int, path: str, payload: dict, timeout: float = 300.0):
+    """Como post_json, pero para endpoints NDJSON: genera un dict por línea."""
+    req = urllib.request.Request(
+        f"http://{host}:{port}{path}",
+        data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+        headers={"Content-Type": "application/json; charset=utf-8"},
+        method="POST",
+    )
+    try:
+        resp = urllib.request.urlopen(req, timeout=timeout)
+    except urllib.error.HTTPError as e:
+        detail = json.loads(e.read() or b"{}").get("error", e.reason)
+        raise RuntimeError(f"El servidor respondió {e.code}: {detail}") from None
+
+    with resp:
+        for line in resp:
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            if "error" in event:
+                raise RuntimeError(f"Error del servidor: {event['error']}")
+            yield event
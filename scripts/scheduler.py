@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# scheduler.py
+#
+# Planificador de peticiones concurrentes para el servidor de 03_query.py
+# (varios visitantes del quiosco preguntando a la vez).
+#
+# Corre un bucle asyncio en un hilo propio; los hilos del servidor HTTP le
+# pasan el trabajo y esperan el resultado:
+#
+#   recuperación   las consultas que llegan casi juntas (hasta `max_batch`,
+#                  esperando como mucho `max_wait_ms`) se resuelven en UN
+#                  lote: un encode() y un producto matriz-matriz. Los lotes
+#                  corren de uno en uno en un solo hilo; lo que llega
+#                  mientras tanto forma el lote siguiente.
+#   generación     cola acotada (`llm_queue`) delante de `llm_workers`
+#                  hilos de LLM. Con la cola llena se rechaza (Busy → 503)
+#                  en vez de acumular esperas; cada petición tiene un
+#                  plazo (Timeout → 504) y se cancela si el cliente se va.
+#
+# Así la Pi tiene a la vez, como mucho, un lote de embeddings y
+# `llm_workers` generaciones, cada uno con sus hilos (embeddings.threads,
+# model.threads), sin repartir los 4 núcleos entre más trabajos de los que caben.
+# Con varios trabajadores (model.workers en 03_query.py) cada uno es una
+# instancia de Llama propia y la cola los reparte: la pregunta siguiente va
+# al primero que queda libre.
+
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Busy(Exception):
+    status = 503
+
+
+class Timeout(Exception):
+    status = 504
+
+
+class _Job:
+    def __init__(self, query: str, context: str, timeout: float):
+        self.query = query
+        self.context = context
+        self.deadline = time.monotonic() + timeout
+        self.queued_at = time.monotonic()
+        self.events = queue.Queue()
+        self.cancelled = threading.Event()
+        self.timed_out = False
+
+
+_END = object()
+
+
+class Scheduler:
+    """
+    `retrieve_batch(queries, top_k)` devuelve un resultado por consulta;
+    `ask_stream(query, context, worker)` es un generador de eventos del LLM
+    (ver ask_llm_stream en 03_query.py). Cada uno de los `llm_workers`
+    trabajadores toma la siguiente pregunta de la cola en cuanto queda
+    libre, siempre con su propio índice `worker`.
+    """
+
+    def __init__(self, retrieve_batch, ask_stream, max_batch: int = 16, max_wait_ms: float = 10,
+                 llm_queue: int = 4, llm_timeout_s: float = 120, llm_workers: int = 1):
+        self.retrieve_batch = retrieve_batch
+        self.ask_stream_fn = ask_stream
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.llm_queue = llm_queue
+        self.llm_timeout = llm_timeout_s
+        self.llm_workers = llm_workers
+
+        self.cpu = ThreadPoolExecutor(1, thread_name_prefix="retrieve")
+        self.llm_pool = ThreadPoolExecutor(llm_workers, thread_name_prefix="llm")
+        self.busy = [0] * llm_workers     # preguntas atendidas por trabajador
+        # los contadores se tocan desde el bucle, los hilos del LLM y los del servidor
+        self.metrics_lock = threading.Lock()
+        self.metrics = {
+            "batches": 0, "batched_queries": 0, "max_batch": 0,
+            "llm_started": 0, "llm_completed": 0, "llm_rejected": 0, "llm_timeouts": 0, "llm_cancelled": 0,
+            "llm_queue_max": 0, "llm_wait_s_total": 0.0,
+        }
+
+        self.loop = asyncio.new_event_loop()
+        ready = threading.Event()
+        threading.Thread(target=self._run, args=(ready,), name="scheduler", daemon=True).start()
+        ready.wait()
+
+    def _run(self, ready):
+        asyncio.set_event_loop(self.loop)
+        self.requests = asyncio.Queue()
+        self.llm_jobs = asyncio.Queue(maxsize=max(1, self.llm_queue))
+        self.loop.create_task(self._batcher())
+        for worker in range(self.llm_workers):
+            self.loop.create_task(self._llm_worker(worker))
+        ready.set()
+        self.loop.run_forever()
+
+    def _call(self, coro):
+        """Ejecuta una corrutina en el bucle del planificador desde otro hilo."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    # ============================
+    # 1. Recuperación por micro-lotes
+    # ============================
+
+    def retrieve(self, query: str, top_k: int):
+        """Bloquea el hilo que llama hasta que el lote de su consulta se resuelve."""
+        return self._call(self._retrieve(query, top_k))
+
+    async def _retrieve(self, query: str, top_k: int):
+        fut = self.loop.create_future()
+        await self.requests.put((query, top_k, fut))
+        return await fut
+
+    async def _batcher(self):
+        while True:
+            batch = [await self.requests.get()]
+            deadline = self.loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - self.loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.requests.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            await self._run_batch(batch)
+
+    async def _run_batch(self, batch: list):
+        self._count("batches")
+        self._count("batched_queries", len(batch))
+        self._peak("max_batch", len(batch))
+
+        by_k = {}
+        for item in batch:
+            by_k.setdefault(item[1], []).append(item)
+        for top_k, items in by_k.items():
+            try:
+                results = await self.loop.run_in_executor(
+                    self.cpu, self.retrieve_batch, [q for q, _, _ in items], top_k)
+            except Exception as e:
+                for _, _, fut in items:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            for (_, _, fut), res in zip(items, results):
+                if not fut.done():
+                    fut.set_result(res)
+
+    def run_cpu(self, fn, *args):
+        """Ejecuta fn en el hilo de recuperación (en orden con los lotes)."""
+        return self.cpu.submit(fn, *args).result()
+
+    # ============================
+    # 2. Cola del LLM
+    # ============================
+
+    def ask_stream(self, query: str, context: str):
+        """
+        Encola la pregunta (Busy si la cola está llena, antes de responder
+        nada al cliente) y devuelve el generador de sus eventos.
+        """
+        job = _Job(query, context, self.llm_timeout)
+        self._call(self._enqueue(job))
+        return self._events(job)
+
+    def _events(self, job: _Job):
+        """
+        Eventos del LLM para un hilo del servidor. Lanza Timeout si se pasa
+        el plazo; al cerrarse antes de tiempo (cliente desconectado) cancela
+        la petición.
+        """
+        try:
+            while True:
+                remaining = job.deadline - time.monotonic()
+                try:
+                    event = job.events.get(timeout=max(remaining, 0.0))
+                except queue.Empty:
+                    self._count("llm_timeouts")
+                    job.timed_out = True
+                    raise Timeout(f"Sin respuesta del LLM en {self.llm_timeout:.0f} s") from None
+                if event is _END:
+                    return
+                if isinstance(event, Exception):
+                    raise event
+                yield event
+        finally:
+            job.cancelled.set()    # sin efecto si ya terminó
+
+    async def _enqueue(self, job: _Job):
+        try:
+            self.llm_jobs.put_nowait(job)
+        except asyncio.QueueFull:
+            self._count("llm_rejected")
+            raise Busy(f"LLM ocupado: {self.llm_jobs.qsize()} preguntas en cola") from None
+        self._peak("llm_queue_max", self.llm_jobs.qsize())
+
+    async def _llm_worker(self, worker: int):
+        while True:
+            job = await self.llm_jobs.get()
+            if job.cancelled.is_set():
+                if not job.timed_out:
+                    self._count("llm_cancelled")
+                continue
+            self._count("llm_started")
+            self._count("llm_wait_s_total", time.monotonic() - job.queued_at)
+            with self.metrics_lock:
+                self.busy[worker] += 1
+            await self.loop.run_in_executor(self.llm_pool, self._generate, job, worker)
+
+    def _generate(self, job: _Job, worker: int):
+        events = self.ask_stream_fn(job.query, job.context, worker)
+        try:
+            for event in events:
+                if job.cancelled.is_set():
+                    if not job.timed_out:
+                        self._count("llm_cancelled")
+                    return
+                job.events.put(event)
+            self._count("llm_completed")
+        except Exception as e:
+            job.events.put(e)
+        finally:
+            events.close()
+            job.events.put(_END)
+
+    # ============================
+    # 3. Métricas
+    # ============================
+
+    def _count(self, name: str, n=1):
+        with self.metrics_lock:
+            self.metrics[name] += n
+
+    def _peak(self, name: str, value):
+        with self.metrics_lock:
+            self.metrics[name] = max(self.metrics[name], value)
+
+    def stats(self) -> dict:
+        with self.metrics_lock:
+            m = dict(self.metrics)
+            busy = list(self.busy)
+        m["llm_queue_depth"] = self.llm_jobs.qsize()
+        m["llm_queue_limit"] = self.llm_jobs.maxsize
+        m["llm_workers"] = self.llm_workers
+        m["llm_per_worker"] = busy
+        m["avg_batch"] = round(m["batched_queries"] / m["batches"], 2) if m["batches"] else 0.0
+        wait = m.pop("llm_wait_s_total")
+        m["llm_wait_s_avg"] = round(wait / m["llm_started"], 3) if m["llm_started"] else 0.0
+        return m
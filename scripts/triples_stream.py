@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# triples_stream.py
+#
+# Lectura de triples en streaming, para grafos que no caben en memoria.
+#
+# La extracción por entidades necesita todos los triples de un sujeto
+# juntos. Con N-Triples ordenado por sujeto (p. ej. `LC_ALL=C sort`) basta
+# agrupar líneas consecutivas: la memoria la fija la entidad más grande.
+#
+# Un Turtle se convierte antes a N-Triples ordenado por trozos:
+#   1. se corta en bloques de sentencias (separados por líneas en blanco,
+#      como los escribe Protégé) de ~chunk_bytes, repitiendo los @prefix;
+#   2. cada bloque se parsea, se pasa a N-Triples y se ordena en memoria;
+#   3. los trozos ordenados se mezclan (heapq.merge) en un solo archivo,
+#      en pasadas de a lo sumo FAN_IN trozos abiertos a la vez.
+# Los nodos en blanco no pueden cruzar bloques.
+
+import heapq
+import os
+import shutil
+import tempfile
+from itertools import groupby
+
+from rdflib import Graph
+from rdflib.plugins.parsers.ntriples import W3CNTriplesParser
+
+# archivos ordenados que se mezclan a la vez (límite de descriptores abiertos)
+FAN_IN = 64
+
+
+class _ListSink:
+    def __init__(self):
+        self.triples = []
+
+    def triple(self, s, p, o):
+        self.triples.append((s, p, o))
+
+
+def iter_ntriples(path: str):
+    """
+    (clave, (s, p, o)) de un archivo N-Triples, línea a línea. La clave es
+    el sujeto tal como está escrito, con el separador que lo sigue: es lo
+    que decide el orden de `sort`. El parser renombra los nodos en blanco
+    (`_:b1` pasa a un BNode nuevo, el mismo en todas las líneas del
+    archivo), así que el orden no se puede comprobar sobre `s`.
+    """
+    sink = _ListSink()
+    parser = W3CNTriplesParser(sink=sink)     # uno solo: un mapa de nodos en blanco
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            parser.parsestring(line)
+            if sink.triples:
+                stripped = line.lstrip()
+                token = stripped.split(None, 1)[0]
+                key = stripped[:len(token) + 1]
+                for t in sink.triples:
+                    yield key, t
+                sink.triples.clear()
+
+
+def group_by_subject_sorted(keyed_triples):
+    """
+    Agrupa triples consecutivos del mismo sujeto: (sujeto, [(p, o), ...]),
+    a partir de iter_ntriples(). Falla si la entrada no está ordenada (un
+    sujeto partido en dos grupos daría dos entidades incompletas).
+    """
+    previous = None
+    for key, group in groupby(keyed_triples, key=lambda kt: kt[0]):
+        if previous is not None and key <= previous:
+            raise ValueError(
+                f"N-Triples no ordenado por sujeto ({key.strip()} después de {previous.strip()}); "
+                "ordénalo con `LC_ALL=C sort` o usa turtle_to_sorted_ntriples()."
+            )
+        previous = key
+        group = [t for _, t in group]
+        yield group[0][0], [(p, o) for _, p, o in group]
+
+
+# ============================
+# Turtle -> N-Triples ordenado
+# ============================
+
+def _turtle_blocks(path: str, chunk_bytes: int):
+    """Trozos de sentencias Turtle completas, cada uno con los prefijos vistos hasta ahí."""
+    header, block, size = [], [], 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            stripped = line.strip()
+            if stripped.lower().startswith(("@prefix", "@base", "prefix ", "base ")):
+                header.append(line)
+                continue
+            block.append(line)
+            size += len(line)
+            # corte solo en una línea en blanco tras el fin de una sentencia
+            if not stripped and size >= chunk_bytes and _ends_statement(block):
+                yield "".join(header + block)
+                block, size = [], 0
+    if any(line.strip() for line in block):
+        yield "".join(header + block)
+
+
+def _ends_statement(block: list) -> bool:
+    for line in reversed(block):
+        text = line.strip()
+        if text and not text.startswith("#"):
+            return text.endswith(".")
+    return False
+
+
+def _merge_runs(runs: list, out: str) -> int:
+    """Mezcla archivos ordenados en `out`, sin líneas repetidas. Devuelve cuántas escribe."""
+    files = [open(r, encoding="utf-8") for r in runs]
+    n = 0
+    try:
+        with open(out, "w", encoding="utf-8") as f:
+            last = None
+            for line in heapq.merge(*files):
+                if line != last:          # un triple repetido en dos bloques
+                    f.write(line)
+                    n += 1
+                    last = line
+    finally:
+        for fh in files:
+            fh.close()
+    return n
+
+
+def turtle_to_sorted_ntriples(ttl: str, out: str, chunk_bytes: int = 8 * 2**20,
+                              fan_in: int = FAN_IN) -> int:
+    """Convierte `ttl` a N-Triples ordenado en `out`. Devuelve el nº de triples."""
+    runs = []
+    tmpdir = tempfile.mkdtemp(prefix="kg-llm-nt-", dir=os.path.dirname(os.path.abspath(out)))
+    try:
+        for i, chunk in enumerate(_turtle_blocks(ttl, chunk_bytes)):
+            g = Graph()
+            g.parse(data=chunk, format="turtle")
+            lines = sorted(l for l in g.serialize(format="nt").splitlines() if l.strip())
+            run = os.path.join(tmpdir, f"run_0_{i:05d}.nt")
+            with open(run, "w", encoding="utf-8") as f:
+                f.writelines(l + "\n" for l in lines)
+            runs.append(run)
+
+        # pasadas de a lo sumo `fan_in` archivos abiertos a la vez
+        level = 0
+        while len(runs) > fan_in:
+            level += 1
+            merged = []
+            for j in range(0, len(runs), fan_in):
+                run = os.path.join(tmpdir, f"run_{level}_{j // fan_in:05d}.nt")
+                _merge_runs(runs[j:j + fan_in], run)
+                for r in runs[j:j + fan_in]:
+                    os.remove(r)
+                merged.append(run)
+            runs = merged
+
+        return _merge_runs(runs, out)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# vector_index.py
+#
+# Formato en disco del índice de embeddings y su carga con np.memmap.
+#
+# Un índice es un directorio:
+#   meta.json      formato, dtype, nº de vectores, dimensión, build_id y
+#                  particiones por nivel: {"A": [inicio, fin], "B": [...]}
+#   vectors.npy    vectores YA normalizados (float32 | float16 | int8)
+#   scales.npy     escala por vector (solo int8): v ≈ q * scale
+#   ids.json       URI de cada fila
+#   hashes.json    hash de contenido por fila (para reconstrucción incremental)
+#
+# Al cargar no se copia nada: vectors.npy se abre con mmap y el producto
+# punto se hace por bloques, convirtiendo a float32 solo el bloque actual.
+#
+# También se aceptan los .npz antiguos (vectors/ids[/hashes]), que se
+# cargan en memoria y se normalizan como antes.
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+INDEX_FORMAT = 1
+DTYPES = ("float32", "float16", "int8")
+
+# filas por bloque al puntuar (acota la memoria temporal en float32)
+SCORE_CHUNK = 65536
+
+
+# ============================
+# 1. Utilidades
+# ============================
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Normaliza cada fila de una matriz de vectores (para usar producto punto como coseno)."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0.0] = 1.0
+    return vectors / norms
+
+
+def quantize(vectors: np.ndarray, dtype: str):
+    """
+    Convierte vectores float32 normalizados al dtype de almacenamiento.
+    Devuelve (vectores, escalas); escalas es None salvo en int8.
+    """
+    if dtype == "float32":
+        return vectors.astype(np.float32), None
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0.0] = 1.0
+        q = np.rint(vectors / scales[:, None]).astype(np.int8)
+        return q, scales.astype(np.float32)
+    raise ValueError(f"dtype no soportado: {dtype} (usa uno de {DTYPES})")
+
+
+def build_id(hashes: list, dtype: str) -> str:
+    """Identificador estable del contenido del índice (cambia si cambia cualquier vector)."""
+    h = hashlib.sha1(dtype.encode("utf-8"))
+    for x in hashes:
+        h.update(x.encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+# ============================
+# 2. Índice cargado
+# ============================
+
+class VectorIndex:
+    """Vectores normalizados (posiblemente cuantizados) + URIs por fila."""
+
+    def __init__(self, vectors, ids, scales=None, hashes=None, meta=None):
+        self.vectors = vectors
+        self.ids = ids
+        self.scales = scales
+        self.hashes = hashes
+        self.meta = meta or {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def partition(self, start: int, stop: int) -> "VectorIndex":
+        """Vista de las filas start:stop (sin copiar los vectores)."""
+        return VectorIndex(
+            self.vectors[start:stop],
+            self.ids[start:stop],
+            scales=None if self.scales is None else self.scales[start:stop],
+            hashes=None if self.hashes is None else self.hashes[start:stop],
+            meta=self.meta,
+        )
+
+    @property
+    def dtype(self) -> str:
+        return str(self.vectors.dtype)
+
+    def rows(self, idxs) -> np.ndarray:
+        """Devuelve las filas pedidas en float32 (descuantizadas)."""
+        out = np.asarray(self.vectors[idxs], dtype=np.float32)
+        if self.scales is not None:
+            out *= np.asarray(self.scales[idxs])[..., None]
+        return out
+
+    def scores(self, q_vec: np.ndarray) -> np.ndarray:
+        """Similitud coseno de q_vec (normalizado) con todas las filas."""
+        q_vec = q_vec.astype(np.float32)
+        if self.vectors.dtype == np.float32:
+            return self.vectors @ q_vec
+
+        out = np.empty(len(self.ids), dtype=np.float32)
+        for start in range(0, len(out), SCORE_CHUNK):
+            stop = start + SCORE_CHUNK
+            out[start:stop] = self.vectors[start:stop].astype(np.float32) @ q_vec
+        if self.scales is not None:
+            out *= self.scales
+        return out
+
+    def scores_many(self, Q: np.ndarray) -> np.ndarray:
+        """Similitudes de varias consultas (m x dim) a la vez: matriz m x N."""
+        Q = Q.astype(np.float32)
+        if self.vectors.dtype == np.float32:
+            return Q @ self.vectors.T
+
+        out = np.empty((len(Q), len(self.ids)), dtype=np.float32)
+        for start in range(0, len(self.ids), SCORE_CHUNK):
+            stop = start + SCORE_CHUNK
+            out[:, start:stop] = Q @ self.vectors[start:stop].astype(np.float32).T
+        if self.scales is not None:
+            out *= self.scales
+        return out
+
+
+# ============================
+# 3. Guardar / cargar
+# ============================
+
+def save_index(path: str, vectors: np.ndarray, ids: list, hashes: list, dtype: str = "float32",
+               partitions: dict | None = None):
+    """
+    Normaliza, cuantiza y escribe el índice en el directorio `path`.
+    `partitions` ({nombre: [inicio, fin]}) describe rangos contiguos de filas.
+    """
+    vectors = normalize(np.asarray(vectors, dtype=np.float32))
+    stored, scales = quantize(vectors, dtype)
+
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, "vectors.npy"), stored)
+    scales_path = os.path.join(path, "scales.npy")
+    if scales is not None:
+        np.save(scales_path, scales)
+    elif os.path.exists(scales_path):
+        os.remove(scales_path)
+
+    with open(os.path.join(path, "ids.json"), "w", encoding="utf-8") as f:
+        json.dump(list(ids), f, ensure_ascii=False)
+    with open(os.path.join(path, "hashes.json"), "w", encoding="utf-8") as f:
+        json.dump(list(hashes), f)
+
+    meta = {
+        "format": INDEX_FORMAT,
+        "dtype": dtype,
+        "count": len(ids),
+        "dim": int(stored.shape[1]) if stored.ndim == 2 else 0,
+        "build_id": build_id(hashes, dtype),
+        "partitions": partitions or {},
+    }
+    with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def _load_npz(path: str) -> VectorIndex:
+    """Formato antiguo de 02_build_index.py (np.savez)."""
+    data = np.load(path)
+    keys = list(data.files)
+
+    # vectores
+    if "vectors" in keys:
+        vectors = data["vectors"]
+    elif "embeddings" in keys:
+        vectors = data["embeddings"]
+    else:
+        raise KeyError(
+            f"No se encontraron claves 'vectors' ni 'embeddings' en {path}. "
+            f"Claves disponibles: {keys}"
+        )
+
+    # identificadores
+    if "ids" in keys:
+        ids = data["ids"]
+    elif "uris" in keys:
+        ids = data["uris"]
+    else:
+        raise KeyError(
+            f"No se encontraron claves 'ids' ni 'uris' en {path}. "
+            f"Claves disponibles: {keys}"
+        )
+
+    hashes = data["hashes"].tolist() if "hashes" in keys else None
+    vectors = normalize(vectors.astype(np.float32))
+    return VectorIndex(vectors, ids.tolist(), hashes=hashes, meta={"dtype": "float32"})
+
+
+def load_index(path: str, mmap: bool = True) -> VectorIndex:
+    """Carga un índice (directorio nuevo o .npz antiguo)."""
+    if path.endswith(".npz"):
+        return _load_npz(path)
+
+    with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("format") != INDEX_FORMAT:
+        raise ValueError(f"Formato de índice desconocido en {path}: {meta.get('format')}")
+
+    mode = "r" if mmap else None
+    vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode=mode)
+    scales = None
+    if meta["dtype"] == "int8":
+        scales = np.load(os.path.join(path, "scales.npy"), mmap_mode=mode)
+
+    with open(os.path.join(path, "ids.json"), encoding="utf-8") as f:
+        ids = json.load(f)
+
+    hashes = None
+    hashes_path = os.path.join(path, "hashes.json")
+    if os.path.exists(hashes_path):
+        with open(hashes_path, encoding="utf-8") as f:
+            hashes = json.load(f)
+
+    return VectorIndex(vectors, ids, scales=scales, hashes=hashes, meta=meta)
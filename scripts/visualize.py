@@ -2,15 +2,28 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import os
 from pathlib import Path
 from collections import defaultdict
 
+import yaml
+
 import networkx as nx
-from rdflib import Graph, URIRef, Literal
+from rdflib import URIRef, Literal
 from rdflib.namespace import RDF, RDFS, OWL, XSD
 
 from pyvis.network import Network
 
+from graph_snapshot import load_graph
+
+# misma configuración que 01_extract_entities.py: así ambos comparten el
+# snapshot de paths.snapshot en vez de compilar uno cada uno
+CONFIG = os.environ.get("KG_LLM_CONFIG", "/home/pi/Documents/kg-llm/config.yaml")
+cfg = yaml.safe_load(open(CONFIG, encoding="utf-8"))
+
+TTL = cfg["paths"]["ttl"]
+SNAP = cfg["paths"].get("snapshot")
+
 
 # -------------------------
 # Utilidades
@@ -45,7 +58,7 @@ def looks_technical_pred(pu: str) -> bool:
 # Clasificación (para color y forma)
 # -------------------------
 
-def detect_kinds(rdf: Graph):
+def detect_kinds(rdf):
     """
     Devuelve sets de URIs (str):
       - classes: owl:Class
@@ -59,7 +72,7 @@ def detect_kinds(rdf: Graph):
     individuals = set(str(s) for s, _, _ in rdf.triples((None, RDF.type, OWL.NamedIndividual)) if is_uri(s))
     return classes, objprops, annprops, individuals
 
-def load_labels(rdf: Graph):
+def load_labels(rdf):
     labels = {}
     for s, _, o in rdf.triples((None, RDFS.label, None)):
         if is_uri(s) and (is_lit(o)):
@@ -88,8 +101,10 @@ def load_graph_for_visualization(
     allowed_pred_localnames: set | None = None,
     include_literals: bool = False,     # si True, crea nodos para literales (suele ensuciar)
 ):
-    rdf = Graph()
-    rdf.parse(ttl_path, format="turtle")
+    # snapshot binario: solo se re-parsea Turtle si cambió. Para el TTL
+    # configurado es el de paths.snapshot; otro TTL usa uno junto a él
+    same_ttl = os.path.realpath(ttl_path) == os.path.realpath(TTL)
+    rdf = load_graph(ttl_path, SNAP if same_ttl else None)
 
     classes, objprops, annprops, individuals = detect_kinds(rdf)
     labels = load_labels(rdf)
@@ -328,7 +343,7 @@ def nx_to_pyvis_html(
 
 def main():
     ap = argparse.ArgumentParser(description="TTL -> HTML interactivo (PyVis) mostrando clases/propiedades/individuos")
-    ap.add_argument("--ttl", default="data/grafo.ttl", help="Ruta al .ttl")
+    ap.add_argument("--ttl", default=TTL, help="Ruta al .ttl (por defecto paths.ttl)")
     ap.add_argument("--html", default="data/grafo_interactivo.html", help="Salida HTML")
     ap.add_argument("--mode", default="full", choices=["full", "semantic"], help="full=todo, semantic=solo relaciones clave")
     ap.add_argument("--physics", default="barnesHut", choices=["barnesHut", "repulsion", "forceatlas2"], help="Layout")
@@ -0,0 +1,86 @@
+# Un campo con varios valores debe dar la misma entidad por los tres
+# caminos de 01_extract_entities.py: grafo rdflib, snapshot y streaming.
+
+import importlib.util
+import os
+import sys
+
+import pytest
+import yaml
+from rdflib import Graph, URIRef
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+sys.path.insert(0, SCRIPTS)
+
+import graph_snapshot  # noqa: E402
+import triples_stream  # noqa: E402
+
+TTL = """@prefix : <http://example.org/festividades#> .
+@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+
+:Quechua a :Lengua ;
+  rdfs:label "Runa simi"@qu ;
+  rdfs:label "Quechua"@es ;
+  :nivelEmbeddings "B" .
+
+:Ruta a :Ruta ;
+  rdfs:label "Ruta 24h"@es ;
+  rdfs:label "Lomada"@es ;
+  rdfs:comment "Nombre local: lomada."@es .
+"""
+
+
+@pytest.fixture
+def extract(tmp_path, monkeypatch):
+    """Carga 01_extract_entities.py con una configuración en tmp_path."""
+    config = tmp_path / "config.yaml"
+    config.write_text(yaml.safe_dump({"paths": {
+        "ttl": str(tmp_path / "grafo.ttl"),
+        "entities": str(tmp_path / "entities.jsonl"),
+        "expanded": str(tmp_path / "expanded.jsonl"),
+    }}))
+    (tmp_path / "grafo.ttl").write_text(TTL, encoding="utf-8")
+    monkeypatch.setenv("KG_LLM_CONFIG", str(config))
+    spec = importlib.util.spec_from_file_location("extract_entities", os.path.join(SCRIPTS, "01_extract_entities.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _entities(extract, records):
+    return {str(s): extract.build_entity(s, rec) for s, rec in records}
+
+
+def _stream_records(extract, ttl, nt):
+    triples_stream.turtle_to_sorted_ntriples(ttl, nt)
+    for s, pairs in triples_stream.group_by_subject_sorted(triples_stream.iter_ntriples(nt)):
+        rec = extract._new_record()
+        for p, o in pairs:
+            extract._add_triple(rec, p, o)
+        yield s, rec
+
+
+def test_multivalued_label_is_the_same_on_every_path(extract, tmp_path):
+    ttl = str(tmp_path / "grafo.ttl")
+    g = Graph()
+    g.parse(ttl, format="turtle")
+
+    from_graph = _entities(extract, extract.group_by_subject(g).items())
+    from_snapshot = _entities(extract, extract.group_by_subject(
+        graph_snapshot.load_graph(ttl, str(tmp_path / "grafo.snapshot"))).items())
+    from_stream = _entities(extract, _stream_records(extract, ttl, str(tmp_path / "grafo.nt")))
+
+    quechua = "http://example.org/festividades#Quechua"
+    ruta = "http://example.org/festividades#Ruta"
+    assert from_graph[quechua]["label"] == "Quechua"       # @es antes que @qu
+    assert from_graph[ruta]["label"] == "Lomada"           # entre @es, el menor
+    assert from_graph == from_snapshot == from_stream
+
+
+def test_pick_value_ignores_triple_order(extract):
+    g = Graph()
+    g.parse(data=TTL, format="turtle")
+    labels = list(g.objects(URIRef("http://example.org/festividades#Quechua"),
+                            URIRef("http://www.w3.org/2000/01/rdf-schema#label")))
+    assert extract.pick_value(labels) == extract.pick_value(labels[::-1])
+    assert extract.pick_value([]) is None